@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers as default_cors_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -133,11 +135,45 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'utils.pagination.CachedCountPagination',
     'PAGE_SIZE': 10,
-    'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework.authentication.TokenAuthentication'],
+    # TokenAuthentication с кешем токенов (utils.authentication)
+    'DEFAULT_AUTHENTICATION_CLASSES': ['utils.authentication.CachedTokenAuthentication'],
+}
+
+# Кеш версий моделей (utils.cache), ответов, COUNT(*) и токенов. ETag, кеш
+# ответов и токенов согласованы между процессами, только если кеш общий: при
+# нескольких процессах (воркеры gunicorn/uwsgi) задайте CACHE_BACKEND и
+# CACHE_LOCATION, например django.core.cache.backends.redis.RedisCache и
+# redis://127.0.0.1:6379/1. LocMemCache по умолчанию - только для одного
+# процесса (runserver, тесты).
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
 }
 
+# Кеш COUNT(*) для списков (utils.pagination.CachedCountPagination)
+PAGINATION_COUNT_CACHE_TIMEOUT = 60 * 60
+# Выше этого числа строк используется оценка количества (None - всегда точно)
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = 10000
+
+# Кеш ответов для анонимных пользователей (utils.views.CachedResponseMixin)
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+
+# Кеш токенов аутентификации: записей в LRU процесса и время жизни записи
+# (utils.authentication.CachedTokenAuthentication)
+TOKEN_AUTH_CACHE_SIZE = 1024
+TOKEN_AUTH_CACHE_TIMEOUT = 60 * 10
+
+# Минимум оценок для попадания фильма в топы (m во взвешенном рейтинге, utils.charts)
+TOP_CHART_MIN_VOTES = 10
+
+# Ширины уменьшенных постеров и фото и число процессов для их создания (utils.images)
+IMAGE_VARIANT_WIDTHS = (80, 240, 480)
+IMAGE_VARIANT_WORKERS = 2
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:8080",
     "http://127.0.0.1:8080",
@@ -151,3 +187,7 @@ CSRF_TRUSTED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+
+# Валидаторы условных GET (utils.views.ConditionalGetMixin) доступны фронтенду
+CORS_EXPOSE_HEADERS = ['ETag', 'Last-Modified']
+CORS_ALLOW_HEADERS = (*default_cors_headers, 'if-none-match', 'if-modified-since')
@@ -2,6 +2,7 @@ from django.contrib import admin, messages
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from catalog import models
+from utils.images import smallest_variant_url
 
 
 class ProfessionInline(admin.StackedInline):
@@ -82,7 +83,9 @@ class MovieAdmin(admin.ModelAdmin):
 
     @admin.display()
     def poster_preview(self, obj):
-        return mark_safe(f'<img src="{obj.poster.url}" width="40" />') if obj.poster else 'Нет постера'
+        if not obj.poster:
+            return 'Нет постера'
+        return mark_safe(f'<img src="{smallest_variant_url(obj.poster, obj.poster_variants)}" width="40" />')
 
     @admin.display()
     def poster_detail_preview(self, obj):
@@ -111,17 +114,19 @@ class PersonAdmin(admin.ModelAdmin):
     def display_movies(self, obj):
         return ", ".join(obj.movies.values_list('title', flat=True)[:5])
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('biography_text')
+
     @admin.display()
     def display_biography(self, obj):
-        if obj.biography and obj.biography.path.endswith(('.txt', '.srt')):
-            with open(obj.biography.path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                return content[:100] + "…" if len(content) > 100 else content
-        return "Нет биографии"
+        # Отрывок сохраняется при загрузке файла, диск в списке не читается
+        return obj.biography_excerpt or "Нет биографии"
 
     @admin.display()
     def photo_preview(self, obj):
-        return mark_safe(f'<img src="{obj.photo.url}" width="40" />') if obj.photo else 'Нет фото'
+        if not obj.photo:
+            return 'Нет фото'
+        return mark_safe(f'<img src="{smallest_variant_url(obj.photo, obj.photo_variants)}" width="40" />')
 
     @admin.display()
     def photo_detail_preview(self, obj):
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_triggers(sender, **kwargs):
+    from utils.search import ensure_movie_search_triggers, ensure_person_search_triggers
+    ensure_movie_search_triggers()
+    ensure_person_search_triggers()
 
 
 class CatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalog'
+
+    def ready(self):
+        from catalog import signals  # noqa: F401
+        post_migrate.connect(ensure_search_triggers, sender=self)
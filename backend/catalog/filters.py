@@ -1,6 +1,10 @@
-from django.db.models.functions import ExtractYear
+from datetime import date
+
 from django_filters import rest_framework as filters
 from catalog import models
+from utils.lookups import VersionedLookup
+from utils.querysets import birthday_ordering
+from utils.search import search_movie_queryset, search_person_biography
 
 
 class UserFilter(filters.FilterSet):
@@ -20,30 +24,42 @@ class UserFilter(filters.FilterSet):
         fields = ['search', 'sort']
 
 
+def build_movie_lookup():
+    years = models.Movie.objects.filter(release_date__isnull=False).dates('release_date', 'year', order='DESC')
+    return {
+        'years': [value.year for value in years],
+        'genres': dict(models.Genre.objects.values_list('name', 'id')),
+        'countries': dict(models.Country.objects.values_list('name', 'id')),
+    }
+
+
+# Допустимые значения фильтров фильмов: проверка параметра не обращается к БД
+movie_lookup = VersionedLookup(['movie', 'genre', 'country'], build_movie_lookup)
+
+
+def year_choices():
+    return [(year, year) for year in movie_lookup.get()['years']]
+
+
+def genre_choices():
+    return [(name, name) for name in movie_lookup.get()['genres']]
+
+
+def country_choices():
+    return [(name, name) for name in movie_lookup.get()['countries']]
+
+
 class MovieFilter(filters.FilterSet):
 
-    search = filters.CharFilter(field_name='title', lookup_expr='iregex')
+    search = filters.CharFilter(method='filter_search')
 
     type = filters.ChoiceFilter(choices=models.Movie.Type.choices)
 
-    year = filters.ModelChoiceFilter(
-        queryset=models.Movie.objects
-        .annotate(year=ExtractYear('release_date')).values_list('year', flat=True).distinct(),
-        to_field_name='year',
-        field_name='release_date__year',
-    )
+    year = filters.TypedChoiceFilter(choices=year_choices, coerce=int, method='filter_year')
 
-    genre = filters.ModelChoiceFilter(
-        queryset=models.Genre.objects,
-        field_name='genres',
-        to_field_name='name'
-    )
+    genre = filters.ChoiceFilter(choices=genre_choices, method='filter_genre')
 
-    country = filters.ModelChoiceFilter(
-        queryset=models.Country.objects,
-        field_name='countries',
-        to_field_name='name'
-    )
+    country = filters.ChoiceFilter(choices=country_choices, method='filter_country')
 
     sort = filters.OrderingFilter(
         fields=[
@@ -57,10 +73,45 @@ class MovieFilter(filters.FilterSet):
         model = models.Movie
         fields = ['search', 'type', 'year', 'genre', 'country', 'sort']
 
+    @staticmethod
+    def filter_search(queryset, name, value):
+        return search_movie_queryset(queryset, value)
+
+    @staticmethod
+    def filter_year(queryset, name, value):
+        # Диапазон дат вместо __year: используется индекс по release_date
+        return queryset.filter(release_date__gte=date(value, 1, 1), release_date__lt=date(value + 1, 1, 1))
+
+    @staticmethod
+    def filter_related(queryset, kind, value):
+        # Значение могли удалить после проверки выбора: справочник к этому времени уже пересобран
+        pk = movie_lookup.get()[kind].get(value)
+        if pk is None:
+            return queryset.none()
+        return queryset.filter(**{kind: pk})
+
+    @classmethod
+    def filter_genre(cls, queryset, name, value):
+        return cls.filter_related(queryset, 'genres', value)
+
+    @classmethod
+    def filter_country(cls, queryset, name, value):
+        return cls.filter_related(queryset, 'countries', value)
+
+
+class PersonOrderingFilter(filters.OrderingFilter):
+
+    def get_ordering_value(self, param):
+        # sort=birthday - ближайшие дни рождения с переходом через конец года
+        if param.lstrip('-') == 'birthday':
+            return birthday_ordering(descending=param.startswith('-'))
+        return super().get_ordering_value(param)
+
 
 class PersonFilter(filters.FilterSet):
 
     search = filters.CharFilter(field_name='full_name', lookup_expr='iregex')
+    bio = filters.CharFilter(method='filter_bio')
 
     sex = filters.ChoiceFilter(choices=models.Person.Type.choices)
     movie = filters.ModelChoiceFilter(
@@ -69,17 +120,22 @@ class PersonFilter(filters.FilterSet):
         to_field_name='id'
     )
 
-    sort = filters.OrderingFilter(
+    sort = PersonOrderingFilter(
         fields=[
             ('full_name', 'full_name'),
             ('birth_date', 'birth_date'),
-            ('_days_to_birthday', 'birthday'),
+            ('birthday_key', 'birthday'),
         ]
     )
 
     class Meta:
         model = models.Person
-        fields = ['movie', 'sex', 'search', 'sort']
+        fields = ['movie', 'sex', 'search', 'bio', 'sort']
+
+    @staticmethod
+    def filter_bio(queryset, name, value):
+        # Полнотекстовый поиск по тексту биографий (utils.search)
+        return search_person_biography(queryset, value)
 
 
 class ReviewFilter(filters.FilterSet):
@@ -0,0 +1,73 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catalog.signals import IMAGE_FIELDS
+from utils.images import render_variants, save_variants
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает уменьшенные WebP/JPEG варианты постеров и фото для уже загруженных файлов. '
+        'По умолчанию обрабатываются только файлы без актуальных вариантов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать варианты для всех файлов')
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_VARIANT_WORKERS)
+        parser.add_argument('--batch-size', type=int, default=32, help='Файлов в памяти одновременно')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as executor:
+            for model, (field_name, variants_field) in IMAGE_FIELDS.items():
+                processed = self.process_model(executor, model, field_name, variants_field, options)
+                self.stdout.write(f'{model._meta.verbose_name_plural}: обработано {processed}')
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.perf_counter() - started:.1f} с'))
+
+    def process_model(self, executor, model, field_name, variants_field, options):
+        queryset = (model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                    .only('pk', field_name, variants_field).order_by('pk'))
+        processed = 0
+        batch = []
+        for instance in queryset.iterator():
+            field_file = getattr(instance, field_name)
+            if not options['force'] and getattr(instance, variants_field).get('source') == field_file.name:
+                continue
+            batch.append(instance)
+            if len(batch) >= options['batch_size']:
+                processed += self.process_batch(executor, batch, field_name, variants_field)
+                batch = []
+        if batch:
+            processed += self.process_batch(executor, batch, field_name, variants_field)
+        return processed
+
+    def process_batch(self, executor, batch, field_name, variants_field):
+        futures = []
+        for instance in batch:
+            field_file = getattr(instance, field_name)
+            try:
+                with field_file.open('rb') as file:
+                    data = file.read()
+            except OSError as error:
+                self.stderr.write(f'{type(instance).__name__} {instance.pk}: {error}')
+                continue
+            futures.append((instance, executor.submit(render_variants, data, settings.IMAGE_VARIANT_WIDTHS)))
+
+        # Как и finish_variants: поврежденный файл не прерывает обработку остальных
+        processed = 0
+        for instance, future in futures:
+            try:
+                save_variants(type(instance), instance.pk, field_name, variants_field, {
+                    'source': getattr(instance, field_name).name,
+                    'variants': future.result(),
+                })
+            except Exception as error:
+                self.stderr.write(f'{type(instance).__name__} {instance.pk}: {error!r}')
+            else:
+                processed += 1
+        return processed
@@ -0,0 +1,64 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog import models
+from utils.similarity import top_k_similar
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает похожие фильмы по оценкам пользователей: для каждого фильма '
+        'сохраняются top-k соседей по adjusted cosine (или cosine) сходству'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=20, help='Количество похожих фильмов')
+        parser.add_argument('--min-common', type=int, default=2, help='Минимум общих оценивших пользователей')
+        parser.add_argument('--metric', choices=['adjusted-cosine', 'cosine'], default='adjusted-cosine')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Фильмов в одном блоке умножения')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        ratings = np.fromiter(
+            models.Rating.objects.order_by().values_list('user_id', 'movie_id', 'rate').iterator(),
+            dtype=[('user', np.int64), ('movie', np.int64), ('rate', np.float64)],
+        )
+        user_ids, user_index = np.unique(ratings['user'], return_inverse=True)
+        movie_ids, movie_index = np.unique(ratings['movie'], return_inverse=True)
+        self.stdout.write(
+            f'Оценок {len(ratings)}, пользователей {len(user_ids)}, фильмов {len(movie_ids)}'
+        )
+
+        movie_ids = movie_ids.tolist()
+        neighbours = top_k_similar(
+            user_index, movie_index, ratings['rate'], (len(user_ids), len(movie_ids)),
+            k=options['k'],
+            min_common=options['min_common'],
+            adjusted=options['metric'] == 'adjusted-cosine',
+            chunk_size=options['chunk_size'],
+        )
+
+        # Пары пишутся пачками по мере расчета, старые данные заменяются в одной транзакции
+        saved = 0
+        batch = []
+        with transaction.atomic():
+            models.MovieSimilarity.objects.all().delete()
+            for movie, similar, scores in neighbours:
+                batch += [
+                    models.MovieSimilarity(movie_id=movie_ids[movie], similar_id=movie_ids[index], score=score)
+                    for index, score in zip(similar.tolist(), scores.tolist())
+                ]
+                if len(batch) >= options['batch_size']:
+                    models.MovieSimilarity.objects.bulk_create(batch)
+                    saved += len(batch)
+                    batch = []
+            models.MovieSimilarity.objects.bulk_create(batch)
+            saved += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Сохранено пар {saved} за {time.perf_counter() - started:.1f} с'
+        ))
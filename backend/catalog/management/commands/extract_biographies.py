@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from catalog import models
+from utils.biographies import read_stored
+from utils.cache import bump_version
+
+
+class Command(BaseCommand):
+    help = (
+        'Извлекает текст и отрывок из уже загруженных файлов биографий (files/biographies/) '
+        'и обновляет полнотекстовый индекс. По умолчанию обрабатываются только личности без отрывка'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Обработать все файлы')
+        parser.add_argument('--workers', type=int, default=4, help='Потоков чтения файлов')
+        parser.add_argument('--batch-size', type=int, default=200, help='Файлов в памяти одновременно')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        queryset = models.Person.objects.exclude(biography='').exclude(biography__isnull=True)
+        if not options['force']:
+            queryset = queryset.filter(biography_excerpt='')
+        # id и имя файла: полный текст уже обработанных не загружается
+        persons = queryset.order_by('pk').values_list('pk', 'biography').iterator()
+        storage = models.Person._meta.get_field('biography').storage
+
+        processed = failed = 0
+        batch = []
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for item in persons:
+                batch.append(item)
+                if len(batch) >= options['batch_size']:
+                    done, errors = self.process_batch(executor, storage, batch)
+                    processed, failed, batch = processed + done, failed + errors, []
+                    self.stdout.write(f'Обработано {processed}')
+            if batch:
+                done, errors = self.process_batch(executor, storage, batch)
+                processed, failed = processed + done, failed + errors
+
+        # Личности без файла, у которых остался текст от удаленного файла
+        cleared = (models.Person.objects.filter(Q(biography='') | Q(biography__isnull=True))
+                   .exclude(biography_excerpt='').update(biography_text='', biography_excerpt=''))
+
+        # bulk_update и update не отправляют сигналы
+        bump_version('person')
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {processed}, ошибок {failed}, очищено {cleared} '
+            f'за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def process_batch(self, executor, storage, batch):
+        def read(item):
+            pk, name = item
+            try:
+                return pk, read_stored(storage, name)
+            except OSError as error:
+                self.stderr.write(f'Person {pk}: {error}')
+                return pk, None
+
+        persons = []
+        for pk, result in executor.map(read, batch):
+            if result is not None:
+                text, excerpt = result
+                persons.append(models.Person(pk=pk, biography_text=text, biography_excerpt=excerpt))
+        models.Person.objects.bulk_update(persons, ['biography_text', 'biography_excerpt'])
+        return len(persons), len(batch) - len(persons)
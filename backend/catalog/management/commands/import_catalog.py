@@ -0,0 +1,185 @@
+import csv
+import json
+import time
+from datetime import date
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from catalog import models
+from utils.cache import bump_version
+
+
+LIST_FIELDS = ('genres', 'countries', 'actors', 'directors')
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковый импорт фильмов из JSONL или CSV. Одна строка - один фильм: '
+        'title, type, release_date, description, trailer_url, genres, countries, actors, directors. '
+        'В CSV списки разделяются символом "|". Жанры, страны и личности ищутся по названию/ФИО '
+        'и создаются при отсутствии; фильмы с теми же названием и датой выхода пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=Path)
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help='По умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.suffix.lower() == '.csv' else 'jsonl')
+        batch_size = options['batch_size']
+
+        self.genres = dict(models.Genre.objects.values_list('name', 'id'))
+        self.countries = dict(models.Country.objects.values_list('name', 'id'))
+        # Однофамильцы: используется первая созданная личность с таким ФИО
+        self.persons = {}
+        for full_name, person_id in models.Person.objects.order_by('id').values_list('full_name', 'id'):
+            self.persons.setdefault(full_name, person_id)
+
+        started = time.perf_counter()
+        created = skipped = processed = 0
+        batch = []
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                for row in self.read_rows(file, file_format):
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        batch_created = self.import_batch(batch)
+                        created += batch_created
+                        skipped += len(batch) - batch_created
+                        processed += len(batch)
+                        batch = []
+                        self.report(processed, created, skipped, started)
+                if batch:
+                    batch_created = self.import_batch(batch)
+                    created += batch_created
+                    skipped += len(batch) - batch_created
+                    processed += len(batch)
+        finally:
+            # bulk_create не отправляет сигналы, поэтому версии кешей сбрасываем вручную,
+            # в том числе после ошибки: предыдущие пачки уже сохранены
+            bump_version('movie', 'genre', 'country', 'person', 'profession')
+        self.report(processed, created, skipped, started)
+        self.stdout.write(self.style.SUCCESS('Импорт завершен'))
+
+    def report(self, processed, created, skipped, started):
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(
+            f'Обработано {processed}, создано {created}, пропущено {skipped} '
+            f'за {elapsed:.1f} с ({rate:.0f} строк/с)'
+        )
+
+    @staticmethod
+    def read_rows(file, file_format):
+        if file_format == 'csv':
+            for line_number, row in enumerate(csv.DictReader(file), start=2):
+                for field in LIST_FIELDS:
+                    value = row.get(field) or ''
+                    row[field] = [item.strip() for item in value.split('|') if item.strip()]
+                yield line_number, row
+            return
+
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as error:
+                raise CommandError(f'Строка {line_number}: {error}')
+            if not isinstance(row, dict):
+                raise CommandError(f'Строка {line_number}: ожидается объект JSON')
+            yield line_number, row
+
+    @staticmethod
+    def validate_row(line_number, row):
+        # Строка вместо списка перебиралась бы по символам и создала однобуквенные жанры
+        for field in LIST_FIELDS:
+            value = row.get(field) or []
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                raise CommandError(f'Строка {line_number}: {field} должен быть списком строк')
+            row[field] = [item.strip() for item in value if item.strip()]
+        movie_type = row.get('type') or models.Movie.Type.MOVIE
+        if movie_type not in models.Movie.Type.values:
+            raise CommandError(
+                f'Строка {line_number}: неизвестный type {movie_type!r}, '
+                f'допустимы {", ".join(models.Movie.Type.values)}'
+            )
+        row['type'] = movie_type
+
+    def import_batch(self, batch):
+        movies = []
+        rows = []
+        seen = set()
+        existing = self.existing_movies(batch)
+        for line_number, row in batch:
+            self.validate_row(line_number, row)
+            try:
+                title = row['title'].strip()
+                release_date = date.fromisoformat(row['release_date']) if row.get('release_date') else None
+            except (KeyError, AttributeError, TypeError, ValueError) as error:
+                raise CommandError(f'Строка {line_number}: некорректные title или release_date ({error})')
+            if (title, release_date) in existing or (title, release_date) in seen:
+                continue
+            seen.add((title, release_date))
+            movies.append(models.Movie(
+                type=row['type'],
+                title=title,
+                release_date=release_date,
+                description=row.get('description') or None,
+                trailer_url=row.get('trailer_url') or None,
+            ))
+            rows.append(row)
+
+        if not movies:
+            return 0
+
+        with transaction.atomic():
+            self.create_missing(models.Genre, 'name', self.genres, rows, ['genres'])
+            self.create_missing(models.Country, 'name', self.countries, rows, ['countries'])
+            self.create_missing(models.Person, 'full_name', self.persons, rows, ['actors', 'directors'])
+
+            models.Movie.objects.bulk_create(movies)
+
+            # Строки связей вставляются через executemany: для сотен тысяч строк
+            # компиляция bulk_create по объектам моделей дороже самой вставки
+            genres, countries, professions = [], [], []
+            for movie, row in zip(movies, rows):
+                genres += [(movie.pk, self.genres[name]) for name in set(row.get('genres') or [])]
+                countries += [(movie.pk, self.countries[name]) for name in set(row.get('countries') or [])]
+                for field, profession in (('actors', models.Profession.Type.ACTOR),
+                                          ('directors', models.Profession.Type.DIRECTOR)):
+                    professions += [(movie.pk, self.persons[name], profession) for name in row.get(field) or []]
+
+            self.insert_rows(models.Movie.genres.through, ['movie_id', 'genre_id'], genres)
+            self.insert_rows(models.Movie.countries.through, ['movie_id', 'country_id'], countries)
+            self.insert_rows(models.Profession, ['movie_id', 'person_id', 'name'], professions)
+        return len(movies)
+
+    @staticmethod
+    def insert_rows(model, columns, rows):
+        if not rows:
+            return
+        quote = connection.ops.quote_name
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(model._meta.db_table),
+            ', '.join(quote(column) for column in columns),
+            ', '.join(['%s'] * len(columns)),
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    @staticmethod
+    def existing_movies(batch):
+        titles = {row['title'].strip() for _, row in batch if isinstance(row.get('title'), str)}
+        return set(models.Movie.objects.filter(title__in=titles).values_list('title', 'release_date'))
+
+    @staticmethod
+    def create_missing(model, field, lookup, rows, row_fields):
+        names = {name for row in rows for row_field in row_fields for name in row.get(row_field) or []}
+        missing = [model(**{field: name}) for name in names - lookup.keys()]
+        model.objects.bulk_create(missing)
+        lookup.update((getattr(obj, field), obj.pk) for obj in missing)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from catalog import models
+from utils.ratings import rebuild_movie_ratings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сумму, количество и среднее оценок для всех фильмов'
+
+    def handle(self, *args, **options):
+        updated = rebuild_movie_ratings(models.Movie.objects.all(), models.Rating)
+        self.stdout.write(self.style.SUCCESS(f'Обновлено фильмов: {updated}'))
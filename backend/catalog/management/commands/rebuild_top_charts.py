@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from catalog import models
+from utils.charts import get_global_mean, rebuild_top_charts
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестраивает топы по взвешенному рейтингу и обновляет среднюю оценку C. '
+        'Между запусками позиции обновляются сигналами оценок с прежним C'
+    )
+
+    def handle(self, *args, **options):
+        entries = rebuild_top_charts(models.TopChartEntry, models.Movie)
+        mean = get_global_mean(models.TopChartEntry, models.Movie)
+        self.stdout.write(self.style.SUCCESS(f'Позиций в топах: {entries}, средняя оценка {mean:.3f}'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from catalog import models
+from utils.cache import bump_version
+from utils.user_stats import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счетчики просмотров, оценок и рецензий пользователей с таблицами оценок и рецензий '
+        'и исправляет расхождения (например, после bulk_create или правок в обход ORM)'
+    )
+
+    def handle(self, *args, **options):
+        created, fixed = rebuild_user_stats(models.UserStats, models.Rating, models.Review)
+        if created or fixed:
+            bump_version('user')
+        self.stdout.write(self.style.SUCCESS(f'Создано счетчиков: {created}, исправлено: {fixed}'))
@@ -0,0 +1,177 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from catalog import models
+from utils import recommendations
+
+
+RATING_DTYPE = [('user', np.int64), ('movie', np.int64), ('rate', np.float64), ('watched', np.bool_)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Обучает модель матричной факторизации (implicit ALS) по оценкам и просмотрам '
+        'и сохраняет для каждого пользователя список рекомендованных фильмов. '
+        'С --incremental пересчитываются только пользователи с новыми, измененными или удаленными оценками '
+        'по ранее обученным векторам фильмов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true')
+        parser.add_argument('--factors', type=int, default=32)
+        parser.add_argument('--iterations', type=int, default=10)
+        parser.add_argument('--regularization', type=float, default=0.1)
+        parser.add_argument('--alpha', type=float, default=10.0, help='Вес уверенности')
+        parser.add_argument('--like-threshold', type=int, default=6, help='Оценка, с которой фильм считается понравившимся')
+        parser.add_argument('--count', type=int, default=50, help='Рекомендаций на пользователя')
+        parser.add_argument('--workers', type=int, help='Потоков для расчета, по умолчанию по числу ядер')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.started = time.perf_counter()
+        computed_at = timezone.now()
+        if options['incremental']:
+            self.incremental(computed_at)
+        else:
+            self.full(computed_at)
+
+    def report(self, message):
+        self.stdout.write(f'[{time.perf_counter() - self.started:.1f} с] {message}')
+
+    def load_ratings(self, queryset):
+        return np.fromiter(
+            queryset.order_by().values_list('user_id', 'movie_id', 'rate', 'is_watched').iterator(),
+            dtype=RATING_DTYPE,
+        )
+
+    def weights(self, ratings):
+        return recommendations.interaction_weights(
+            ratings['rate'], ratings['watched'], self.options['alpha'], self.options['like_threshold']
+        )
+
+    def full(self, computed_at):
+        ratings = self.load_ratings(models.Rating.objects.all())
+        user_ids, user_index = np.unique(ratings['user'], return_inverse=True)
+        movie_ids, movie_index = np.unique(ratings['movie'], return_inverse=True)
+        self.report(f'Оценок {len(ratings)}, пользователей {len(user_ids)}, фильмов {len(movie_ids)}')
+
+        preference, confidence = self.weights(ratings)
+        user_factors, movie_factors = recommendations.train_als(
+            user_index, movie_index, preference, confidence, (len(user_ids), len(movie_ids)),
+            factors=self.options['factors'],
+            regularization=self.options['regularization'],
+            iterations=self.options['iterations'],
+            workers=self.options['workers'],
+        )
+        self.report('Модель обучена')
+
+        with transaction.atomic():
+            models.MovieFactor.objects.all().delete()
+            self.bulk_create(
+                models.MovieFactor(movie_id=movie_id, vector=vector.astype(np.float32).tobytes())
+                for movie_id, vector in zip(movie_ids.tolist(), movie_factors)
+            )
+            models.UserRecommendation.objects.all().delete()
+            saved = self.save_recommendations(
+                user_ids, user_index, movie_ids, movie_index, user_factors, movie_factors, computed_at
+            )
+            models.RecommendationState.objects.all().delete()
+            self.save_states(user_ids, user_index, computed_at)
+        self.report(f'Сохранено рекомендаций {saved}')
+        self.stdout.write(self.style.SUCCESS('Обучение завершено'))
+
+    def incremental(self, computed_at):
+        # movie_ids должны быть отсортированы: позиции фильмов ищутся через searchsorted
+        factors = list(models.MovieFactor.objects.order_by('movie_id').values_list('movie_id', 'vector').iterator())
+        if not factors:
+            raise CommandError('Векторов фильмов нет, сначала нужно полное обучение')
+        movie_ids = np.array([movie_id for movie_id, _ in factors], dtype=np.int64)
+        movie_factors = np.stack([np.frombuffer(vector, dtype=np.float32) for _, vector in factors])
+        movie_factors = movie_factors.astype(np.float64)
+
+        # Пользователи с оценками новее последнего расчета (или еще не рассчитанные)
+        # и пользователи, у которых изменилось число оценок, то есть оценки удалялись
+        changed_users = set(models.Rating.objects
+                            .filter(Q(user__recommendation_state__isnull=True)
+                                    | Q(updated_at__gt=F('user__recommendation_state__computed_at')))
+                            .order_by().values_list('user_id', flat=True).distinct())
+        ratings_count = (models.Rating.objects
+                         .filter(user=OuterRef('user')).order_by()
+                         .values('user').annotate(count=Count('id')).values('count'))
+        changed_users.update(models.RecommendationState.objects
+                             .annotate(current=Coalesce(Subquery(ratings_count), 0))
+                             .exclude(current=F('ratings_count'))
+                             .values_list('user_id', flat=True))
+        self.report(f'Пользователей для дообучения {len(changed_users)}')
+        if not changed_users:
+            self.stdout.write(self.style.SUCCESS('Новых оценок нет'))
+            return
+        ratings = self.load_ratings(models.Rating.objects.filter(user_id__in=changed_users))
+        user_ids, user_index = np.unique(ratings['user'], return_inverse=True)
+
+        # Фильмы без векторов (добавленные после полного обучения) появятся
+        # в рекомендациях только после следующего полного обучения
+        positions = np.searchsorted(movie_ids, ratings['movie'])
+        positions = np.minimum(positions, len(movie_ids) - 1)
+        known = movie_ids[positions] == ratings['movie']
+        preference, confidence = self.weights(ratings[known])
+        user_factors = recommendations.fold_in_users(
+            user_index[known], positions[known], preference, confidence, len(user_ids), movie_factors,
+            regularization=self.options['regularization'],
+            workers=self.options['workers'],
+        )
+
+        with transaction.atomic():
+            models.UserRecommendation.objects.filter(user_id__in=changed_users).delete()
+            saved = self.save_recommendations(
+                user_ids, user_index[known], movie_ids, positions[known], user_factors, movie_factors, computed_at
+            )
+            # Отметка ставится и тем, кому рекомендовать нечего (все оценки у фильмов
+            # без векторов, оценки удалены): до новых изменений они не пересчитываются
+            models.RecommendationState.objects.filter(user_id__in=changed_users).delete()
+            self.save_states(user_ids, user_index, computed_at)
+        self.report(f'Сохранено рекомендаций {saved}')
+        self.stdout.write(self.style.SUCCESS('Дообучение завершено'))
+
+    def save_recommendations(self, user_ids, user_index, movie_ids, movie_index, user_factors, movie_factors,
+                             computed_at):
+        seen = recommendations.seen_matrix(user_index, movie_index, (len(user_ids), len(movie_ids)))
+        user_ids, movie_ids = user_ids.tolist(), movie_ids.tolist()
+        candidates = recommendations.top_n(user_factors, movie_factors, seen, self.options['count'])
+        return self.bulk_create(
+            models.UserRecommendation(
+                user_id=user_ids[user], movie_id=movie_ids[movie], score=score, created_at=computed_at
+            )
+            for user, movies, scores in candidates
+            # Пользователь без оценок известных модели фильмов получил бы случайный список
+            if user_factors[user].any()
+            for movie, score in zip(movies.tolist(), scores.tolist())
+        )
+
+    def save_states(self, user_ids, user_index, computed_at):
+        counts = np.bincount(user_index, minlength=len(user_ids))
+        return self.bulk_create(
+            models.RecommendationState(user_id=user_id, computed_at=computed_at, ratings_count=count)
+            for user_id, count in zip(user_ids.tolist(), counts.tolist())
+        )
+
+    def bulk_create(self, objects):
+        saved = 0
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.options['batch_size']:
+                type(obj).objects.bulk_create(batch)
+                saved += len(batch)
+                batch = []
+        if batch:
+            type(batch[0]).objects.bulk_create(batch)
+            saved += len(batch)
+        return saved
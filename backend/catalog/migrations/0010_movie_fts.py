@@ -0,0 +1,31 @@
+from django.db import migrations
+
+from utils import search
+
+
+def create_movie_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(search.MOVIE_FTS_CREATE)
+    for sql in search.MOVIE_FTS_TRIGGERS:
+        schema_editor.execute(sql)
+    schema_editor.execute(search.MOVIE_FTS_RANK)
+    schema_editor.execute(search.MOVIE_FTS_REBUILD)
+
+
+def drop_movie_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in search.MOVIE_FTS_DROP:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_person_photo_alter_movie_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_movie_fts, drop_movie_fts),
+    ]
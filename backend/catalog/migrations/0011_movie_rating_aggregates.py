@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+from utils.ratings import rebuild_movie_ratings
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Movie = apps.get_model('catalog', 'Movie')
+    Rating = apps.get_model('catalog', 'Rating')
+    rebuild_movie_ratings(Movie.objects.all(), Rating)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_movie_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='rating_avg',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_sum',
+            field=models.FloatField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
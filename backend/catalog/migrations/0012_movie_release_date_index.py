@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_movie_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movie',
+            name='release_date',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='Дата выхода'),
+        ),
+    ]
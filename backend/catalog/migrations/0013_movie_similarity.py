@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_movie_release_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='catalog.movie', verbose_name='Кино')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='catalog.movie', verbose_name='Похожее кино')),
+            ],
+            options={
+                'verbose_name': 'Похожее кино',
+                'verbose_name_plural': 'Похожее кино',
+                'ordering': ['movie', '-score'],
+                'indexes': [models.Index(fields=['movie', '-score'], name='catalog_similarity_movie_idx')],
+            },
+        ),
+    ]
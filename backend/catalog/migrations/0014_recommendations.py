@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_movie_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieFactor',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='factor', serialize=False, to='catalog.movie', verbose_name='Кино')),
+                ('vector', models.BinaryField(verbose_name='Вектор')),
+            ],
+            options={
+                'verbose_name': 'Вектор фильма',
+                'verbose_name_plural': 'Векторы фильмов',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Оценка модели')),
+                ('created_at', models.DateTimeField(verbose_name='Дата расчета')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_to', to='catalog.movie', verbose_name='Кино')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Рекомендация',
+                'verbose_name_plural': 'Рекомендации',
+                'ordering': ['user', '-score'],
+                'indexes': [models.Index(fields=['user', '-score'], name='catalog_recommendation_idx')],
+            },
+        ),
+    ]
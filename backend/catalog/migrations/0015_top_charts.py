@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from utils.charts import rebuild_top_charts
+
+
+def fill_top_charts(apps, schema_editor):
+    rebuild_top_charts(apps.get_model('catalog', 'TopChartEntry'), apps.get_model('catalog', 'Movie'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopChartEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chart', models.CharField(max_length=64, verbose_name='Топ')),
+                ('score', models.FloatField(verbose_name='Взвешенный рейтинг')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chart_entries', to='catalog.movie', verbose_name='Кино')),
+            ],
+            options={
+                'verbose_name': 'Позиция в топе',
+                'verbose_name_plural': 'Позиции в топах',
+                'ordering': ['chart', '-score'],
+                'indexes': [models.Index(fields=['chart', '-score'], name='catalog_top_chart_idx'), models.Index(fields=['movie'], name='catalog_top_chart_movie_idx')],
+            },
+        ),
+        migrations.RunPython(fill_top_charts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:04
+
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import ExtractDay, ExtractMonth
+
+
+def fill_birthday_keys(apps, schema_editor):
+    Person = apps.get_model('catalog', 'Person')
+    Person.objects.filter(birth_date__isnull=False).update(
+        birthday_key=ExtractMonth('birth_date') * Value(100) + ExtractDay('birth_date'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0016_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='birthday_key',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='День рождения (ММДД)'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['birthday_key', 'id'], name='catalog_person_birthday_idx'),
+        ),
+        migrations.RunPython(fill_birthday_keys, migrations.RunPython.noop),
+    ]
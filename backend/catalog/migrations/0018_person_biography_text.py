@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+from utils import search
+from utils.biographies import read_stored
+
+
+def fill_biography_text(apps, schema_editor):
+    # Уже загруженные файлы; индекс строится следующей операцией по заполненному тексту.
+    # Недоступные файлы пропускаются - их покажет команда extract_biographies
+    Person = apps.get_model('catalog', 'Person')
+    storage = Person._meta.get_field('biography').storage
+    persons = list(Person.objects.exclude(biography='').exclude(biography__isnull=True).values_list('pk', 'biography'))
+    for pk, name in persons:
+        try:
+            text, excerpt = read_stored(storage, name)
+        except OSError:
+            continue
+        Person.objects.filter(pk=pk).update(biography_text=text, biography_excerpt=excerpt)
+
+
+def create_person_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(search.PERSON_FTS_CREATE)
+    for sql in search.PERSON_FTS_TRIGGERS:
+        schema_editor.execute(sql)
+    schema_editor.execute(search.PERSON_FTS_REBUILD)
+
+
+def drop_person_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in search.PERSON_FTS_DROP:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0017_person_birthday_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='biography_excerpt',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200, verbose_name='Начало биографии'),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='biography_text',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Текст биографии'),
+        ),
+        migrations.RunPython(fill_biography_text, migrations.RunPython.noop),
+        migrations.RunPython(create_person_fts, drop_person_fts),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from utils.user_stats import rebuild_user_stats
+
+
+def fill_user_stats(apps, schema_editor):
+    rebuild_user_stats(
+        apps.get_model('catalog', 'UserStats'), apps.get_model('catalog', 'Rating'), apps.get_model('catalog', 'Review'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0018_person_biography_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('watches', models.PositiveIntegerField(default=0, verbose_name='Просмотров')),
+                ('rates', models.PositiveIntegerField(default=0, verbose_name='Оценок')),
+                ('reviews', models.PositiveIntegerField(default=0, verbose_name='Рецензий')),
+            ],
+            options={
+                'verbose_name': 'Счетчики пользователя',
+                'verbose_name_plural': 'Счетчики пользователей',
+                'indexes': [models.Index(fields=['watches', 'user'], name='catalog_user_stats_watches_idx'), models.Index(fields=['rates', 'user'], name='catalog_user_stats_rates_idx'), models.Index(fields=['reviews', 'user'], name='catalog_user_stats_reviews_idx')],
+            },
+        ),
+        migrations.RunPython(fill_user_stats, migrations.RunPython.noop),
+    ]
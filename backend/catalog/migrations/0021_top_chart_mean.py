@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+from utils.charts import rebuild_top_charts
+
+
+def fill_top_chart_mean(apps, schema_editor):
+    # Полная перестройка: сохраненный C и все позиции согласованы
+    rebuild_top_charts(apps.get_model('catalog', 'TopChartEntry'), apps.get_model('catalog', 'Movie'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0020_recommendation_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopChartMean',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mean', models.FloatField(verbose_name='Средняя оценка')),
+            ],
+            options={
+                'verbose_name': 'Средняя оценка топов',
+                'verbose_name_plural': 'Средняя оценка топов',
+            },
+        ),
+        migrations.RunPython(fill_top_chart_mean, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.urls import reverse
 
+from utils.biographies import read_upload
+from utils.querysets import birthday_key
+
 
 class User(AbstractUser):
 
@@ -63,7 +66,7 @@ class Movie(models.Model):
 
     type = models.CharField(max_length=200, verbose_name='Тип', choices=Type.choices, default=Type.MOVIE, null=True)
     title = models.CharField(max_length=200, verbose_name='Название')
-    release_date = models.DateField(verbose_name='Дата выхода', blank=True, null=True)
+    release_date = models.DateField(verbose_name='Дата выхода', blank=True, null=True, db_index=True)
     description = models.TextField(verbose_name='Описание', blank=True, null=True)
     genres = models.ManyToManyField('Genre', verbose_name='Жанры', related_name='movies', blank=True)
     countries = models.ManyToManyField('Country', verbose_name='Страны', related_name='movies', blank=True)
@@ -75,6 +78,17 @@ class Movie(models.Model):
         help_text='Загрузите постер фильма'
     )
     trailer_url = models.URLField(blank=True, null=True, verbose_name='Ссылка на трейлер')
+    # Уменьшенные копии постера, создаются в фоне (см. utils.images)
+    poster_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Варианты постера')
+    # Агрегаты оценок, обновляются сигналами Rating (см. utils.ratings)
+    rating_sum = models.FloatField(default=0, editable=False, verbose_name='Сумма оценок')
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок')
+    rating_avg = models.FloatField(
+        blank=True, null=True, editable=False, db_index=True, verbose_name='Средняя оценка'
+    )
+
+    RATING_FIELDS = ('rating_sum', 'rating_count', 'rating_avg')
+    BACKGROUND_FIELDS = RATING_FIELDS + ('poster_variants',)
 
     objects = models.Manager()
     movies = MovieManager()
@@ -88,6 +102,12 @@ class Movie(models.Model):
             old = Movie.objects.get(pk=self.pk)
             if old.poster and old.poster != self.poster:
                 old.poster.delete(save=False)
+            # Не перезаписываем агрегаты оценок и варианты постера устаревшими значениями из памяти
+            if kwargs.get('update_fields') is None:
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in self.BACKGROUND_FIELDS
+                ]
         except Movie.DoesNotExist:
             pass
 
@@ -130,19 +150,62 @@ class Person(models.Model):
         verbose_name='Фото',
         help_text='Загрузите фото личности'
     )
+    # Уменьшенные копии фото, создаются в фоне (см. utils.images)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Варианты фото')
+    # Текст файла биографии извлекается один раз при загрузке (utils.biographies),
+    # по нему строится полнотекстовый индекс (utils.search)
+    biography_text = models.TextField(blank=True, default='', editable=False, verbose_name='Текст биографии')
+    biography_excerpt = models.CharField(
+        max_length=200, blank=True, default='', editable=False, verbose_name='Начало биографии'
+    )
+    # Месяц * 100 + день рождения; индекс для выборки ближайших дней рождения
+    birthday_key = models.PositiveSmallIntegerField(
+        blank=True, null=True, editable=False, verbose_name='День рождения (ММДД)'
+    )
     movies = models.ManyToManyField(
         'Movie', verbose_name='Фильмы', related_name='movies', through='Profession', blank=True
     )
 
+    BACKGROUND_FIELDS = ('photo_variants',)
+
     objects = models.Manager()
 
     def __str__(self):
         return f'{self.full_name}, {self.birth_date}'
 
+    def save(self, *args, **kwargs):
+        # Не перезаписываем варианты фото, созданные в фоне, устаревшим значением из памяти;
+        # отложенные поля, как и при обычном save(), не сохраняются
+        if kwargs.get('update_fields') is None and not self._state.adding:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.BACKGROUND_FIELDS
+                and field.attname not in deferred
+            ]
+
+        self.birthday_key = birthday_key(self.birth_date)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'birth_date' in update_fields:
+            kwargs['update_fields'] = update_fields = {*update_fields, 'birthday_key'}
+
+        if self.biography and not self.biography._committed:
+            self.biography_text, self.biography_excerpt = read_upload(self.biography)
+        elif not self.biography and self.biography_excerpt:
+            self.biography_text, self.biography_excerpt = '', ''
+        else:
+            update_fields = None
+        if update_fields is not None and 'biography' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'biography_text', 'biography_excerpt'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Личность"
         verbose_name_plural = "Личности"
         ordering = ['-birth_date']
+        indexes = [
+            models.Index(fields=['birthday_key', 'id'], name='catalog_person_birthday_idx'),
+        ]
 
     def get_absolute_url(self):
         return reverse('catalog:person-detail', args=[self.pk])
@@ -208,6 +271,18 @@ class Rating(models.Model):
 
     objects = models.Manager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения из БД нужны сигналам, чтобы скорректировать агрегаты фильма и счетчики пользователя
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Сигналы обновляют агрегаты фильма и счетчики пользователя в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f'user={self.user}, movie={self.movie}, rate={self.rate}'
 
@@ -259,6 +334,17 @@ class Review(models.Model):
 
     objects = models.Manager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Автор из БД нужен сигналам, чтобы скорректировать счетчики пользователя
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return self.title
 
@@ -269,3 +355,146 @@ class Review(models.Model):
 
     def get_absolute_url(self):
         return reverse('catalog:review-detail', args=[self.pk])
+
+
+# Похожие фильмы, рассчитываются командой build_movie_similarity
+class MovieSimilarity(models.Model):
+    movie = models.ForeignKey('Movie', on_delete=models.CASCADE, verbose_name='Кино', related_name='similarities')
+    similar = models.ForeignKey(
+        'Movie', on_delete=models.CASCADE, verbose_name='Похожее кино', related_name='similar_to'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    objects = models.Manager()
+
+    def __str__(self):
+        return f'movie={self.movie_id}, similar={self.similar_id}, score={self.score:.3f}'
+
+    class Meta:
+        verbose_name = "Похожее кино"
+        verbose_name_plural = "Похожее кино"
+        ordering = ['movie', '-score']
+        indexes = [models.Index(fields=['movie', '-score'], name='catalog_similarity_movie_idx')]
+
+
+# Векторы фильмов из матричной факторизации (команда train_recommendations),
+# нужны для дообучения пользователей без полного пересчета
+class MovieFactor(models.Model):
+    movie = models.OneToOneField(
+        'Movie', on_delete=models.CASCADE, primary_key=True, verbose_name='Кино', related_name='factor'
+    )
+    vector = models.BinaryField(verbose_name='Вектор')
+
+    objects = models.Manager()
+
+    def __str__(self):
+        return f'movie={self.movie_id}'
+
+    class Meta:
+        verbose_name = "Вектор фильма"
+        verbose_name_plural = "Векторы фильмов"
+
+
+class UserRecommendation(models.Model):
+    user = models.ForeignKey(
+        'User', on_delete=models.CASCADE, verbose_name='Пользователь', related_name='recommendations'
+    )
+    movie = models.ForeignKey(
+        'Movie', on_delete=models.CASCADE, verbose_name='Кино', related_name='recommended_to'
+    )
+    score = models.FloatField(verbose_name='Оценка модели')
+    created_at = models.DateTimeField(verbose_name='Дата расчета')
+
+    objects = models.Manager()
+
+    def __str__(self):
+        return f'user={self.user_id}, movie={self.movie_id}, score={self.score:.3f}'
+
+    class Meta:
+        verbose_name = "Рекомендация"
+        verbose_name_plural = "Рекомендации"
+        ordering = ['user', '-score']
+        indexes = [models.Index(fields=['user', '-score'], name='catalog_recommendation_idx')]
+
+
+# Когда пользователь последний раз обрабатывался train_recommendations и сколько
+# у него тогда было оценок: по ним дообучение находит новые, измененные и удаленные оценки
+class RecommendationState(models.Model):
+    user = models.OneToOneField(
+        'User', on_delete=models.CASCADE, primary_key=True, verbose_name='Пользователь',
+        related_name='recommendation_state'
+    )
+    computed_at = models.DateTimeField(verbose_name='Дата расчета')
+    ratings_count = models.PositiveIntegerField(verbose_name='Оценок при расчете')
+
+    objects = models.Manager()
+
+    def __str__(self):
+        return f'user={self.user_id}, computed_at={self.computed_at}'
+
+    class Meta:
+        verbose_name = "Состояние рекомендаций"
+        verbose_name_plural = "Состояния рекомендаций"
+
+
+# Материализованные топы по взвешенному (байесовскому) рейтингу, см. utils.charts.
+# chart: 'all', 'type:<тип>', 'genre:<id>' или 'country:<id>'
+class TopChartEntry(models.Model):
+    chart = models.CharField(max_length=64, verbose_name='Топ')
+    movie = models.ForeignKey('Movie', on_delete=models.CASCADE, verbose_name='Кино', related_name='chart_entries')
+    score = models.FloatField(verbose_name='Взвешенный рейтинг')
+
+    objects = models.Manager()
+
+    def __str__(self):
+        return f'chart={self.chart}, movie={self.movie_id}, score={self.score:.3f}'
+
+    class Meta:
+        verbose_name = "Позиция в топе"
+        verbose_name_plural = "Позиции в топах"
+        ordering = ['chart', '-score']
+        indexes = [
+            models.Index(fields=['chart', '-score'], name='catalog_top_chart_idx'),
+            models.Index(fields=['movie'], name='catalog_top_chart_movie_idx'),
+        ]
+
+
+# Средняя оценка C, с которой посчитаны позиции топов (utils.charts); одна строка.
+# Хранится вместе с топами: после вытеснения из кеша обновления позиций
+# используют тот же C, что и последняя полная перестройка
+class TopChartMean(models.Model):
+    mean = models.FloatField(verbose_name='Средняя оценка')
+
+    objects = models.Manager()
+
+    def __str__(self):
+        return f'mean={self.mean:.3f}'
+
+    class Meta:
+        verbose_name = "Средняя оценка топов"
+        verbose_name_plural = "Средняя оценка топов"
+
+
+# Счетчики пользователя, обновляются сигналами Rating и Review (см. utils.user_stats).
+# Отдельная таблица: полное сохранение User не перезапишет их устаревшими значениями
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        'User', on_delete=models.CASCADE, primary_key=True, verbose_name='Пользователь', related_name='stats'
+    )
+    watches = models.PositiveIntegerField(default=0, verbose_name='Просмотров')
+    rates = models.PositiveIntegerField(default=0, verbose_name='Оценок')
+    reviews = models.PositiveIntegerField(default=0, verbose_name='Рецензий')
+
+    objects = models.Manager()
+
+    def __str__(self):
+        return f'user={self.user_id}, watches={self.watches}, rates={self.rates}, reviews={self.reviews}'
+
+    class Meta:
+        verbose_name = "Счетчики пользователя"
+        verbose_name_plural = "Счетчики пользователей"
+        indexes = [
+            models.Index(fields=['watches', 'user'], name='catalog_user_stats_watches_idx'),
+            models.Index(fields=['rates', 'user'], name='catalog_user_stats_rates_idx'),
+            models.Index(fields=['reviews', 'user'], name='catalog_user_stats_reviews_idx'),
+        ]
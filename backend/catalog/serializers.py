@@ -2,18 +2,17 @@ from django.contrib.auth.password_validation import validate_password
 from django.db.models import F
 from rest_framework.authtoken.models import Token
 from rest_framework.serializers import (
-    ModelSerializer,
     CharField,
     ValidationError,
     SerializerMethodField,
 )
 from random import choice
 from utils.serializers import BaseModelSerializer, get_fields
-from utils.querysets import annotate_movie_queryset
+from utils.images import build_srcset
 from catalog import models
 
 
-class UserSerializer(ModelSerializer):
+class UserSerializer(BaseModelSerializer):
     class Meta:
         model = models.User
         fields = ['id', 'username', 'email', 'password']
@@ -84,7 +83,7 @@ class UserListSerializer(UserSerializer):
 class PersonSerializer(BaseModelSerializer):
     class Meta:
         model = models.Person
-        exclude = []
+        exclude = ['photo_variants', 'biography_text', 'biography_excerpt', 'birthday_key']
 
 
 class ProfessionSerializer(BaseModelSerializer):
@@ -93,61 +92,50 @@ class ProfessionSerializer(BaseModelSerializer):
         exclude = []
 
 
-class GenreSerializer(ModelSerializer):
+class GenreSerializer(BaseModelSerializer):
     class Meta:
         model = models.Genre
         fields = '__all__'
 
 
-class GenreListSerializer(GenreSerializer):
-    movies_count = SerializerMethodField()
-    random_poster = SerializerMethodField()
+# Количество фильмов из аннотации _movies_count, обложка - случайный постер
+# из пула, переданного во view через context['poster_pool']
+class CoverListSerializerMixin:
 
     @staticmethod
     def get_movies_count(obj):
+        if hasattr(obj, '_movies_count'):
+            return obj._movies_count
         return obj.movies.count()
 
     def get_random_poster(self, obj):
-        movies = obj.movies.exclude(poster='')
-        posters = [movie.poster for movie in movies if movie.poster]
+        posters = self.context.get('poster_pool', {}).get(obj.pk)
         if not posters:
             return None
-        poster = choice(posters)
+        url = models.Movie._meta.get_field('poster').storage.url(choice(posters))
 
         # Формируем полный URL
         request = self.context.get('request')
         if request:
-            return request.build_absolute_uri(poster.url)
-        return poster.url
+            return request.build_absolute_uri(url)
+        return url
+
+
+class GenreListSerializer(CoverListSerializerMixin, GenreSerializer):
+    movies_count = SerializerMethodField()
+    random_poster = SerializerMethodField()
 
 
-class CountrySerializer(ModelSerializer):
+class CountrySerializer(BaseModelSerializer):
     class Meta:
         model = models.Country
         exclude = []
 
 
-class CountryListSerializer(CountrySerializer):
+class CountryListSerializer(CoverListSerializerMixin, CountrySerializer):
     movies_count = SerializerMethodField()
     random_poster = SerializerMethodField()
 
-    @staticmethod
-    def get_movies_count(obj):
-        return obj.movies.count()
-
-    def get_random_poster(self, obj):
-        movies = obj.movies.exclude(poster='')
-        posters = [movie.poster for movie in movies if movie.poster]
-        if not posters:
-            return None
-        poster = choice(posters)
-
-        # Формируем полный URL
-        request = self.context.get('request')
-        if request:
-            return request.build_absolute_uri(poster.url)
-        return poster.url
-
 
 class RatingSerializer(BaseModelSerializer):
     class Meta:
@@ -155,7 +143,7 @@ class RatingSerializer(BaseModelSerializer):
         exclude = []
 
 
-class ReviewSerializer(ModelSerializer):
+class ReviewSerializer(BaseModelSerializer):
     class Meta:
         model = models.Review
         exclude = []
@@ -202,17 +190,25 @@ class MovieInfoSerializer(MovieSerializer):
     def get_user_actions(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            rating = obj.ratings.filter(user=request.user)
-            return rating.values('id', 'rate', 'is_watched')[0] if rating.exists() else None
+            # Заполняется в MovieViewSet.get_queryset через prefetch_user_ratings
+            ratings = getattr(obj, '_user_ratings', None)
+            if ratings is None:
+                ratings = obj.ratings.filter(user=request.user)[:1]
+            rating = next(iter(ratings), None)
+            return get_fields(rating, 'id', 'rate', 'is_watched') if rating else None
         return None
 
 
 class MovieListSerializer(MovieInfoSerializer):
+    poster_srcset = SerializerMethodField()
     release_year = SerializerMethodField()
     url = SerializerMethodField()
 
     class Meta(MovieInfoSerializer.Meta):
-        fields = ['id', 'type', 'title', 'poster', 'rate', 'user_actions', 'release_year', 'url']
+        fields = ['id', 'type', 'title', 'poster', 'poster_srcset', 'rate', 'user_actions', 'release_year', 'url']
+
+    def get_poster_srcset(self, obj):
+        return build_srcset(obj.poster.storage, obj.poster_variants, self.context.get('request'))
 
     @staticmethod
     def get_release_year(obj):
@@ -235,17 +231,25 @@ class MovieDetailSerializer(MovieInfoSerializer):
 
     @staticmethod
     def get_rates_count(obj):
-        return obj.ratings.count()
+        return obj.rating_count
 
     @staticmethod
-    def get_actors(obj):
-        actors = obj.professions.exclude(name=models.Profession.Type.DIRECTOR)
-        return actors.select_related('person').values('person__id', 'person__full_name')
+    def get_credits(obj, directors):
+        # Актеры и режиссеры загружаются одним запросом без создания моделей
+        credits = getattr(obj, '_credits', None)
+        if credits is None:
+            credits = obj._credits = list(obj.professions.values('name', 'person__id', 'person__full_name'))
+        return [
+            {'person__id': credit['person__id'], 'person__full_name': credit['person__full_name']}
+            for credit in credits
+            if (credit['name'] == models.Profession.Type.DIRECTOR) == directors
+        ]
 
-    @staticmethod
-    def get_directors(obj):
-        directors = obj.professions.filter(name=models.Profession.Type.DIRECTOR)
-        return directors.select_related('person').values('person__id', 'person__full_name')
+    def get_actors(self, obj):
+        return self.get_credits(obj, directors=False)
+
+    def get_directors(self, obj):
+        return self.get_credits(obj, directors=True)
 
 
 class ProfessionListSerializer(ProfessionSerializer):
@@ -266,15 +270,24 @@ class ProfessionDetailSerializer(ProfessionSerializer):
 
 
 class PersonListSerializer(PersonSerializer):
+    photo_srcset = SerializerMethodField()
     top_5_movies = SerializerMethodField()
 
     class Meta(PersonSerializer.Meta):
         exclude = PersonSerializer.Meta.exclude + ['movies']
         extra_kwargs = {'biography': {'write_only': True}}
 
+    def get_photo_srcset(self, obj):
+        return build_srcset(obj.photo.storage, obj.photo_variants, self.context.get('request'))
+
     @staticmethod
     def get_top_5_movies(obj):
-        return annotate_movie_queryset(obj.movies.all()).values_list('title', flat=True)[:5]
+        # Заполняется в PersonViewSet.get_queryset через prefetch_top_movies
+        professions = getattr(obj, '_top_professions', None)
+        if professions is None:
+            movies = obj.movies.distinct().order_by(F('rating_avg').desc(nulls_last=True), 'id')
+            return [title for _, title in movies.values_list('id', 'title')[:5]]
+        return list({profession.movie_id: profession._title for profession in professions}.values())
 
 
 class PersonDetailSerializer(PersonSerializer):
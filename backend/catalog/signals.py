@@ -0,0 +1,247 @@
+from functools import partial
+
+from django.apps import apps
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from catalog import models
+from utils import charts, images, ratings, user_stats
+from utils.authentication import invalidate_user_tokens
+from utils.cache import bump_version
+
+
+# Производные таблицы пересчитываются пачками или сигналами и ни в одной версии кеша не участвуют.
+# Без подписчиков на их сигналы Django удаляет строки одним DELETE, не загружая объекты
+DERIVED_MODELS = (models.MovieSimilarity, models.MovieFactor, models.UserRecommendation,
+                  models.RecommendationState, models.TopChartEntry, models.TopChartMean, models.UserStats)
+
+
+def bump_model_version(sender, **kwargs):
+    bump_version(sender._meta.model_name)
+
+
+for model in apps.get_app_config('catalog').get_models():
+    if model not in DERIVED_MODELS:
+        post_save.connect(bump_model_version, sender=model, dispatch_uid=f'bump_version_save_{model.__name__}')
+        post_delete.connect(bump_model_version, sender=model, dispatch_uid=f'bump_version_delete_{model.__name__}')
+
+
+@receiver(m2m_changed, sender=models.Movie.genres.through)
+@receiver(m2m_changed, sender=models.Movie.countries.through)
+def bump_movie_relations_version(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_version('movie')
+
+
+# Старые значения, по которым сигналы корректируют агрегаты фильма и счетчики пользователя
+TRACKED_FIELDS = {
+    models.Rating: ('movie_id', 'user_id', 'rate', 'is_watched'),
+    models.Review: ('user_id',),
+}
+
+
+@receiver(pre_save, sender=models.Rating)
+@receiver(pre_save, sender=models.Review)
+@receiver(pre_delete, sender=models.Rating)
+@receiver(pre_delete, sender=models.Review)
+def load_tracked_values(sender, instance, raw=False, **kwargs):
+    # У объекта, загруженного через only()/defer() или созданного не из БД, части
+    # значений в _loaded_values нет: они дочитываются, пока строка еще не изменена
+    if raw or instance.pk is None:
+        return
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    missing = [name for name in TRACKED_FIELDS[sender] if name not in loaded]
+    if missing:
+        values = sender.objects.filter(pk=instance.pk).values(*missing).first()
+        if values is not None:
+            instance._loaded_values = {**loaded, **values}
+
+
+def loaded_values(instance):
+    # Значения строки до удаления; поля, которых нет в _loaded_values, берутся из объекта
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    return {
+        name: loaded[name] if name in loaded else getattr(instance, name)
+        for name in TRACKED_FIELDS[type(instance)]
+    }
+
+
+@receiver(post_save, sender=models.Rating)
+def update_movie_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    movie_ids = {instance.movie_id, (loaded or {}).get('movie_id', instance.movie_id)}
+    if created:
+        ratings.rating_changed(models.Movie, instance)
+    elif loaded is None or not {'movie_id', 'rate'} <= loaded.keys():
+        # Старые значения неизвестны (строка исчезла до сохранения) - пересчитываем фильмы целиком
+        ratings.rebuild_movie_ratings(models.Movie.objects.filter(pk__in=movie_ids), models.Rating)
+    elif loaded['movie_id'] != instance.movie_id or loaded['rate'] != instance.rate:
+        ratings.rating_changed(models.Movie, instance, loaded['movie_id'], loaded['rate'])
+    charts.refresh_movie_scores(models.TopChartEntry, models.Movie, movie_ids)
+    rating_stats_changed(instance, created, loaded)
+    instance._loaded_values = {name: getattr(instance, name) for name in TRACKED_FIELDS[sender]}
+
+
+@receiver(post_delete, sender=models.Rating)
+def update_movie_rating_on_delete(sender, instance, **kwargs):
+    old = loaded_values(instance)
+    ratings.rating_changed(models.Movie, None, old['movie_id'], old['rate'])
+    charts.refresh_movie_scores(models.TopChartEntry, models.Movie, [old['movie_id']])
+    stats = user_stats.rating_stats(old['is_watched'], old['rate'])
+    change_user_stats(old['user_id'], **{name: -value for name, value in stats.items()})
+
+
+def change_user_stats(user_id, **deltas):
+    if not user_stats.apply_stats_delta(models.UserStats, user_id, **deltas):
+        # Строки счетчиков нет (пользователь создан без сигналов) - считаем по оценкам и рецензиям
+        user_stats.rebuild_user_stats(models.UserStats, models.Rating, models.Review, [user_id])
+
+
+def rating_stats_changed(instance, created, loaded):
+    new = user_stats.rating_stats(instance.is_watched, instance.rate)
+    if created:
+        change_user_stats(instance.user_id, **new)
+    elif loaded is None or not {'user_id', 'is_watched', 'rate'} <= loaded.keys():
+        # Старые значения неизвестны - пересчитываем пользователя целиком
+        user_stats.rebuild_user_stats(models.UserStats, models.Rating, models.Review, [instance.user_id])
+    elif loaded['user_id'] != instance.user_id:
+        old = user_stats.rating_stats(loaded['is_watched'], loaded['rate'])
+        change_user_stats(loaded['user_id'], **{name: -value for name, value in old.items()})
+        change_user_stats(instance.user_id, **new)
+    else:
+        old = user_stats.rating_stats(loaded['is_watched'], loaded['rate'])
+        change_user_stats(instance.user_id, **{name: new[name] - old[name] for name in new})
+
+
+@receiver(post_save, sender=models.Review)
+def update_user_stats_on_review_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if created:
+        change_user_stats(instance.user_id, reviews=1)
+    elif loaded is None or 'user_id' not in loaded:
+        user_stats.rebuild_user_stats(models.UserStats, models.Rating, models.Review, [instance.user_id])
+    elif loaded['user_id'] != instance.user_id:
+        change_user_stats(loaded['user_id'], reviews=-1)
+        change_user_stats(instance.user_id, reviews=1)
+    instance._loaded_values = {'user_id': instance.user_id}
+
+
+@receiver(post_delete, sender=models.Review)
+def update_user_stats_on_review_delete(sender, instance, **kwargs):
+    change_user_stats(loaded_values(instance)['user_id'], reviews=-1)
+
+
+@receiver(post_save, sender=models.User)
+def create_user_stats(sender, instance, created, **kwargs):
+    # И при loaddata: пользователь без строки счетчиков не попадет в список
+    if created:
+        models.UserStats.objects.get_or_create(user_id=instance.pk)
+
+
+# Файл изображения и поле с его уменьшенными вариантами
+IMAGE_FIELDS = {models.Movie: ('poster', 'poster_variants'), models.Person: ('photo', 'photo_variants')}
+
+
+@receiver(post_save, sender=models.Movie)
+@receiver(post_save, sender=models.Person)
+def update_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.sync_variants(instance, *IMAGE_FIELDS[sender])
+
+
+@receiver(post_delete, sender=models.Movie)
+@receiver(post_delete, sender=models.Person)
+def delete_image_variants(sender, instance, **kwargs):
+    field_name, variants_field = IMAGE_FIELDS[sender]
+    names = images.variant_names(getattr(instance, variants_field))
+    if names:
+        transaction.on_commit(partial(images.delete_variants, getattr(instance, field_name).storage, names))
+
+
+@receiver(post_save, sender=models.Movie)
+def update_movie_charts(sender, instance, created, raw=False, **kwargs):
+    # Новый фильм без оценок в топы не попадает; при изменении меняется тип
+    if not created and not raw:
+        charts.rebuild_movie_entries(models.TopChartEntry, models.Movie, [instance.pk])
+
+
+@receiver(m2m_changed, sender=models.Movie.genres.through)
+@receiver(m2m_changed, sender=models.Movie.countries.through)
+def update_movie_relation_charts(sender, instance, action, reverse, pk_set, **kwargs):
+    kind = 'genre' if sender is models.Movie.genres.through else 'country'
+    if reverse and action == 'post_clear':
+        models.TopChartEntry.objects.filter(chart=charts.chart_key(kind, instance.pk)).delete()
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        movie_ids = pk_set if reverse else [instance.pk]
+        charts.rebuild_movie_entries(models.TopChartEntry, models.Movie, movie_ids)
+
+
+@receiver(post_delete, sender=models.Genre)
+@receiver(post_delete, sender=models.Country)
+def delete_relation_charts(sender, instance, **kwargs):
+    kind = 'genre' if sender is models.Genre else 'country'
+    models.TopChartEntry.objects.filter(chart=charts.chart_key(kind, instance.pk)).delete()
+
+
+@receiver(post_save, sender=models.User)
+@receiver(post_delete, sender=models.User)
+def invalidate_user_auth(sender, instance, update_fields=None, **kwargs):
+    # Пароль, is_active, права: закешированный для токена пользователь устарел.
+    # Обновление last_login при входе не сбрасывает кеш
+    if update_fields != {'last_login'}:
+        invalidate_user_tokens(instance.pk)
+
+
+def auth_relation_user_ids(sender, instance, reverse, pk_set):
+    # Пользователи, чьи права меняет изменение связи; pk_set=None - все текущие связи (перед clear)
+    if sender is Group.permissions.through:
+        if not reverse:
+            users = models.User.objects.filter(groups=instance)
+        elif pk_set is not None:
+            users = models.User.objects.filter(groups__in=pk_set)
+        else:
+            users = models.User.objects.filter(groups__permissions=instance)
+        return list(users.values_list('id', flat=True).distinct())
+    if not reverse:
+        return [instance.pk]
+    if pk_set is not None:
+        return list(pk_set)
+    field = 'groups' if sender is models.User.groups.through else 'user_permissions'
+    return list(models.User.objects.filter(**{field: instance}).values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=models.User.groups.through)
+@receiver(m2m_changed, sender=models.User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_relations_auth(sender, instance, action, reverse, pk_set, **kwargs):
+    # Группы и разрешения: после clear связей уже нет, поэтому пользователи запоминаются до него
+    if action == 'pre_clear':
+        instance._auth_clear_user_ids = auth_relation_user_ids(sender, instance, reverse, None)
+    elif action == 'post_clear':
+        invalidate_user_tokens(*instance.__dict__.pop('_auth_clear_user_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_user_tokens(*auth_relation_user_ids(sender, instance, reverse, pk_set))
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_users(sender, instance, **kwargs):
+    # Строки связей удаляются каскадом без m2m_changed
+    instance._auth_clear_user_ids = list(instance.user_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Group)
+def invalidate_group_auth(sender, instance, **kwargs):
+    invalidate_user_tokens(*instance.__dict__.pop('_auth_clear_user_ids', []))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token_auth(sender, instance, **kwargs):
+    invalidate_user_tokens(instance.user_id)
@@ -1,3 +1,695 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import threading
+from datetime import date, datetime
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from catalog import filters, models, views
+from utils import charts
+from utils.cache import bump_version, get_version
+from utils.lookups import VersionedLookup
+from utils.pagination import CachedCountPagination, KeysetPagination
+from utils.querysets import BIRTHDAY_TIMEZONE
+from utils.renderers import FastJSONRenderer
+
+
+class CatalogTestCase(TestCase):
+    # Каталог из size фильмов с жанром, страной, актером, режиссером, оценкой и рецензией
+    size = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = models.User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        other = models.User.objects.create_user('critic', 'critic@example.com', 'password')
+        genre = models.Genre.objects.create(name='Драма')
+        country = models.Country.objects.create(name='Россия')
+        for i in range(cls.size):
+            movie = models.Movie.objects.create(title=f'Фильм\u2028{i}', release_date=date(2000 + i, 1, 1))
+            movie.genres.add(genre)
+            movie.countries.add(country)
+            for name in models.Profession.Type.values:
+                person = models.Person.objects.create(full_name=f'{name} {i}', birth_date=date(1980, 1, 1 + i))
+                models.Profession.objects.create(movie=movie, person=person, name=name)
+            models.Rating.objects.create(movie=movie, user=cls.user, rate=7)
+            if i % 2:
+                models.Rating.objects.create(movie=movie, user=other, rate=i % 10 + 1)
+            models.Review.objects.create(
+                movie=movie, user=cls.user, type=models.Review.Type.NEUTRAL, title=f'Рецензия {i}', text='Текст',
+            )
+
+    def setUp(self):
+        self.anonymous = APIClient()
+        self.authenticated = APIClient()
+        self.authenticated.force_authenticate(self.user)
+
+    def get_page(self, client, url, page_size):
+        # Без кешей ответов и COUNT(*): считаются все запросы построения страницы
+        cache.clear()
+        with (mock.patch.object(CachedCountPagination, 'page_size', page_size),
+              mock.patch.object(KeysetPagination, 'page_size', page_size),
+              CaptureQueriesContext(connection) as queries):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), page_size)
+        return response, len(queries)
+
+    def assertPageQueries(self, client, url, expected):
+        # Число запросов не должно зависеть от размера страницы
+        for page_size in (1, self.size):
+            with self.subTest(url=url, page_size=page_size):
+                response, queries = self.get_page(client, url, page_size)
+                self.assertEqual(queries, expected)
+        return response
+
+
+class MovieListQueryCountTests(CatalogTestCase):
+
+    def assertRate(self, result):
+        # rate - средняя оценка из столбца rating_avg, без join с оценками
+        self.assertEqual(result['rate'], models.Movie.objects.get(pk=result['id']).rating_avg)
+
+    def test_anonymous(self):
+        # Страница и COUNT(*); user_actions без запросов
+        response = self.assertPageQueries(self.anonymous, '/catalog/movie/', 2)
+        self.assertRate(response.data['results'][0])
+        self.assertIsNone(response.data['results'][0]['user_actions'])
+
+    def test_authenticated(self):
+        # Оценки пользователя для всей страницы - один запрос
+        response = self.assertPageQueries(self.authenticated, '/catalog/movie/', 3)
+        self.assertEqual(response.data['results'][0]['user_actions']['rate'], 7.0)
+
+    def test_cursor_anonymous(self):
+        # Режим курсора строит страницу сериализатором
+        response = self.assertPageQueries(self.anonymous, '/catalog/movie/?pagination=cursor', 1)
+        self.assertRate(response.data['results'][0])
+
+    def test_cursor_authenticated(self):
+        # Prefetch _user_ratings: один запрос на страницу
+        response = self.assertPageQueries(self.authenticated, '/catalog/movie/?pagination=cursor', 2)
+        self.assertEqual(response.data['results'][0]['user_actions']['rate'], 7.0)
+
+
+class DetailQueryCountTests(CatalogTestCase):
+
+    def test_movie_detail(self):
+        # Фильм, жанры, страны и актеры с режиссерами одним values()
+        movie = models.Movie.objects.first()
+        cache.clear()
+        with self.assertNumQueries(4):
+            response = self.anonymous.get(f'/catalog/movie/{movie.pk}/')
+        self.assertEqual(len(response.data['actors']), 1)
+        self.assertEqual(len(response.data['directors']), 1)
+        self.assertEqual(response.data['rates_count'], 1)
+
+    def test_movie_detail_authenticated(self):
+        movie = models.Movie.objects.first()
+        cache.clear()
+        with self.assertNumQueries(5):
+            response = self.authenticated.get(f'/catalog/movie/{movie.pk}/')
+        self.assertEqual(response.data['user_actions']['rate'], 7.0)
+
+
+class ListQueryCountTests(CatalogTestCase):
+
+    def test_review_list(self):
+        response = self.assertPageQueries(self.anonymous, '/catalog/review/', 2)
+        self.assertEqual(response.data['results'][0]['user'], {'id': self.user.pk, 'username': 'viewer'})
+        self.assertPageQueries(self.anonymous, '/catalog/review/?pagination=cursor', 1)
+
+    def test_rating_list(self):
+        response = self.assertPageQueries(self.anonymous, '/catalog/rating/', 2)
+        self.assertIn('title', response.data['results'][0]['movie'])
+        self.assertPageQueries(self.anonymous, '/catalog/rating/?pagination=cursor', 1)
+
+    def test_person_list(self):
+        # Страница, COUNT(*) и топ-5 фильмов всех личностей страницы
+        response = self.assertPageQueries(self.anonymous, '/catalog/person/', 3)
+        self.assertEqual(len(response.data['results'][0]['top_5_movies']), 1)
+
+
+class RatingSignalTests(TestCase):
+    # Агрегаты фильма и счетчики пользователя при сохранении и удалении объектов,
+    # загруженных не со всеми полями
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = models.User.objects.create_user('rater', 'rater@example.com', 'password')
+        cls.movie = models.Movie.objects.create(title='Фильм')
+        cls.other_movie = models.Movie.objects.create(title='Другой фильм')
+
+    def setUp(self):
+        self.rating = models.Rating.objects.create(movie=self.movie, user=self.user, rate=4, is_watched=False)
+        models.Rating.objects.create(movie=self.movie, user=self.user, rate=8)
+
+    def assertAggregates(self, movie, rating_sum, rating_count):
+        movie.refresh_from_db()
+        self.assertEqual((movie.rating_sum, movie.rating_count), (rating_sum, rating_count))
+        self.assertEqual(movie.rating_avg, rating_sum / rating_count if rating_count else None)
+
+    def assertStats(self, watches, rates, reviews=0):
+        stats = models.UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.watches, stats.rates, stats.reviews), (watches, rates, reviews))
+
+    def test_save_deferred(self):
+        rating = models.Rating.objects.only('id', 'movie_id').get(pk=self.rating.pk)
+        rating.rate = 10
+        rating.is_watched = True
+        rating.save()
+        self.assertAggregates(self.movie, 18, 2)
+        self.assertStats(watches=2, rates=2)
+
+    def test_save_deferred_movie_change(self):
+        rating = models.Rating.objects.only('id', 'rate').get(pk=self.rating.pk)
+        rating.movie = self.other_movie
+        rating.save()
+        self.assertAggregates(self.movie, 8, 1)
+        self.assertAggregates(self.other_movie, 4, 1)
+
+    def test_save_unloaded(self):
+        models.Rating(
+            pk=self.rating.pk, movie=self.movie, user=self.user, rate=6, is_watched=True,
+            created_at=self.rating.created_at,
+        ).save()
+        self.assertAggregates(self.movie, 14, 2)
+        self.assertStats(watches=2, rates=2)
+
+    def test_delete_deferred(self):
+        models.Rating.objects.only('id').get(pk=self.rating.pk).delete()
+        self.assertAggregates(self.movie, 8, 1)
+        self.assertStats(watches=1, rates=1)
+
+    def test_review_delete_deferred(self):
+        review = models.Review.objects.create(
+            movie=self.movie, user=self.user, type=models.Review.Type.NEUTRAL, title='Рецензия', text='Текст',
+        )
+        self.assertStats(watches=1, rates=2, reviews=1)
+        models.Review.objects.only('id').get(pk=review.pk).delete()
+        self.assertStats(watches=1, rates=2, reviews=0)
+
+
+class UserStatsTests(TestCase):
+    # Счетчики просмотров, оценок и рецензий при создании, изменении, переносе и удалении
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = models.User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        cls.other = models.User.objects.create_user('critic', 'critic@example.com', 'password')
+        cls.movie = models.Movie.objects.create(title='Фильм')
+
+    def assertStats(self, user, watches, rates, reviews):
+        stats = models.UserStats.objects.get(user=user)
+        self.assertEqual((stats.watches, stats.rates, stats.reviews), (watches, rates, reviews))
+
+    def create_review(self, user):
+        return models.Review.objects.create(
+            movie=self.movie, user=user, type=models.Review.Type.NEUTRAL, title='Рецензия', text='Текст',
+        )
+
+    def test_ratings(self):
+        rating = models.Rating.objects.create(movie=self.movie, user=self.user, rate=8, is_watched=False)
+        self.assertStats(self.user, 0, 1, 0)
+        rating.is_watched = True
+        rating.save()
+        self.assertStats(self.user, 1, 1, 0)
+        rating.rate = 3
+        rating.save()
+        self.assertStats(self.user, 1, 1, 0)
+        rating.user = self.other
+        rating.save()
+        self.assertStats(self.user, 0, 0, 0)
+        self.assertStats(self.other, 1, 1, 0)
+        rating.delete()
+        self.assertStats(self.other, 0, 0, 0)
+
+    def test_reviews(self):
+        review = self.create_review(self.user)
+        self.create_review(self.user)
+        self.assertStats(self.user, 0, 0, 2)
+        review.user = self.other
+        review.save()
+        self.assertStats(self.user, 0, 0, 1)
+        self.assertStats(self.other, 0, 0, 1)
+        review.delete()
+        self.assertStats(self.other, 0, 0, 0)
+
+    def test_rebuild(self):
+        # Строки, созданные в обход сигналов, исправляет rebuild_user_stats
+        models.Rating.objects.bulk_create([models.Rating(movie=self.movie, user=self.user, rate=5)])
+        models.UserStats.objects.filter(user=self.other).delete()
+        call_command('rebuild_user_stats', stdout=io.StringIO())
+        self.assertStats(self.user, 1, 1, 0)
+        self.assertStats(self.other, 0, 0, 0)
+
+    def test_list_without_stats_row(self):
+        # Пользователь без строки счетчиков не пропадает из списка
+        models.User.objects.bulk_create([models.User(username='imported')])
+        client = APIClient()
+        client.force_authenticate(models.User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        for query in ('', '?sort=-watches', '?fields=id,username'):
+            with self.subTest(query=query):
+                results = client.get(f'/catalog/user/{query}').data['results']
+                imported = [user for user in results if user['username'] == 'imported']
+                self.assertEqual(len(imported), 1)
+                if 'watches' in imported[0]:
+                    self.assertEqual((imported[0]['watches'], imported[0]['rates'], imported[0]['reviews']), (0, 0, 0))
+
+
+class FastJSONRendererTests(CatalogTestCase):
+
+    def test_list_payloads(self):
+        # Ответы списков совпадают с выводом JSONRenderer побайтно
+        for url in ('/catalog/movie/', '/catalog/rating/', '/catalog/review/', '/catalog/profession/'):
+            for client in (self.anonymous, self.authenticated):
+                with self.subTest(url=url, authenticated=client is self.authenticated):
+                    cache.clear()
+                    response = client.get(url)
+                    self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+                    self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_detail_uses_default_renderer(self):
+        response = self.anonymous.get(f'/catalog/movie/{models.Movie.objects.first().pk}/')
+        self.assertIs(type(response.accepted_renderer), JSONRenderer)
+
+    def test_floats(self):
+        for value in (0.0, -0.0, 1e-4, 9.999e-05, 1e-05, -2e-07, 7.333333333333333, 9.999999999999998e15, 1e16, 1.5e22):
+            with self.subTest(value=value):
+                data = {'values': [value, {'nested': (value,)}]}
+                self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_non_finite_floats(self):
+        # Строгий JSONRenderer не допускает NaN и Infinity
+        for value in (float('nan'), float('inf'), float('-inf')):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                FastJSONRenderer().render({'value': value})
+
+
+class PersonFieldsTests(CatalogTestCase):
+    # Служебные столбцы личности не попадают в ответы
+    hidden = ('photo_variants', 'biography_text', 'biography_excerpt', 'birthday_key')
+
+    def test_hidden_fields(self):
+        person = models.Person.objects.first()
+        list_item = self.anonymous.get('/catalog/person/').data['results'][0]
+        detail = self.anonymous.get(f'/catalog/person/{person.pk}/').data
+        birthdays = self.anonymous.get('/catalog/person/birthdays/').data
+        for data in (list_item, detail, birthdays[0]):
+            for name in self.hidden:
+                self.assertNotIn(name, data)
+
+
+class PersonSaveTests(TestCase):
+
+    def test_full_save_keeps_photo_variants(self):
+        # Варианты фото записываются фоном через update(); сохранение объекта,
+        # загруженного раньше, их не затирает
+        person = models.Person.objects.create(full_name='Личность', birth_date=date(1980, 3, 1))
+        variants = {'source': 'images/photos/photo.jpg', 'webp': {'160': 'photo-160.webp'}}
+        models.Person.objects.filter(pk=person.pk).update(photo_variants=variants)
+        person.full_name = 'Новое имя'
+        person.birth_date = date(1981, 4, 2)
+        person.save()
+        person.refresh_from_db()
+        self.assertEqual((person.full_name, person.birthday_key), ('Новое имя', 402))
+        self.assertEqual(person.photo_variants, variants)
+
+    def test_deferred_save(self):
+        person = models.Person.objects.create(full_name='Личность')
+        person = models.Person.objects.defer('biography_text').get(pk=person.pk)
+        person.full_name = 'Новое имя'
+        with self.assertNumQueries(1):
+            person.save()
+        self.assertEqual(models.Person.objects.get(pk=person.pk).full_name, 'Новое имя')
+
+
+def moscow_datetime(*args):
+    # datetime с фиксированным now() для utils.querysets
+    class FixedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(*args, tzinfo=BIRTHDAY_TIMEZONE).astimezone(tz)
+    return FixedDatetime
+
+
+class PersonBirthdaySortTests(CatalogTestCase):
+
+    def get_first(self, day):
+        with mock.patch('utils.querysets.datetime', moscow_datetime(2026, 1, day, 12)):
+            response = self.anonymous.get('/catalog/person/?sort=birthday')
+        return response['ETag'], response['X-Cache'], response.data['results'][0]['birth_date']
+
+    def test_day_change(self):
+        # В полночь меняются порядок, ETag и ключ кеша анонимного ответа
+        etag, _, first = self.get_first(5)
+        self.assertEqual(first, '1980-01-05')
+        self.assertEqual(self.get_first(5), (etag, 'HIT', first))
+        next_etag, cached, next_first = self.get_first(6)
+        self.assertNotEqual(next_etag, etag)
+        self.assertEqual((cached, next_first), ('MISS', '1980-01-06'))
+
+
+class MovieFilterTests(CatalogTestCase):
+
+    def test_genre_and_country(self):
+        for query in ({'genre': 'Драма'}, {'country': 'Россия'}):
+            with self.subTest(query=query):
+                self.assertEqual(self.anonymous.get('/catalog/movie/', query).data['count'], self.size)
+        self.assertEqual(self.anonymous.get('/catalog/movie/', {'genre': 'Комедия'}).status_code, 400)
+
+    def test_deleted_after_validation(self):
+        # Значение прошло проверку выбора, а справочник пересобран без него
+        queryset = models.Movie.objects.all()
+        self.assertFalse(filters.MovieFilter.filter_genre(queryset, 'genre', 'Комедия').exists())
+        self.assertFalse(filters.MovieFilter.filter_country(queryset, 'country', 'Франция').exists())
+
+
+class AutocompleteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hedgehog = models.Movie.objects.create(title='Ёжик в тумане')
+        cls.nebula = models.Movie.objects.create(title='Туманность Андромеды')
+        cls.person = models.Person.objects.create(full_name='Юрий Норштейн')
+        models.Movie.objects.bulk_create(models.Movie(title=f'Серия {i}') for i in range(60))
+
+    def setUp(self):
+        cache.clear()
+        index = VersionedLookup(['movie', 'person', 'genre'], views.build_autocomplete_index, background=True)
+        self.enterContext(mock.patch.object(views, 'autocomplete_index', index))
+
+    def search(self, query, **params):
+        response = self.client.get('/catalog/autocomplete/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item['type'], item['id']) for item in response.data]
+
+    def test_prefix(self):
+        # Совпадения с начала названия выше
+        self.assertEqual(self.search('туман'), [('movie', self.nebula.pk), ('movie', self.hedgehog.pk)])
+        self.assertEqual(self.search('норш'), [('person', self.person.pk)])
+        self.assertEqual(self.search('xyz'), [])
+
+    def test_multiple_words(self):
+        self.assertEqual(self.search('ежик тум'), [('movie', self.hedgehog.pk)])
+        self.assertEqual(self.search('андр тум'), [('movie', self.nebula.pk)])
+        self.assertEqual(self.search('туман юрий'), [])
+
+    def test_limit(self):
+        self.assertEqual(len(self.search('серия')), 10)
+        self.assertEqual(len(self.search('серия', limit=100)), 50)
+        self.assertEqual(len(self.search('серия', limit=-1)), 1)
+        self.assertEqual(self.client.get('/catalog/autocomplete/', {'q': 'серия', 'limit': 'x'}).status_code, 400)
+
+
+class VersionedLookupTests(TestCase):
+
+    def test_background_rebuild(self):
+        # Пока новая версия строится, отдается предыдущая; пересборка одна
+        release = threading.Event()
+        builds = []
+
+        def build():
+            builds.append(len(builds) + 1)
+            if len(builds) > 1:
+                release.wait(5)
+            return builds[-1]
+
+        lookup = VersionedLookup(['lookup_test'], build, background=True)
+        self.assertEqual(lookup.get(), 1)
+        bump_version('lookup_test')
+        self.assertEqual((lookup.get(), lookup.get()), (1, 1))
+        thread = lookup.thread
+        release.set()
+        thread.join(5)
+        self.assertEqual(lookup.get(), 2)
+        self.assertEqual(builds, [1, 2])
+
+
+class LimitParamTests(CatalogTestCase):
+    # ?limit= ограничивается снизу и сверху, нечисловое значение - 400
+
+    def assertLimits(self, url, maximum):
+        for limit, expected in (('-1', 1), ('0', 1), (str(maximum + 1), maximum)):
+            with self.subTest(url=url, limit=limit):
+                response = self.authenticated.get(url, {'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(response.data), expected)
+        self.assertEqual(self.authenticated.get(url, {'limit': 'abc'}).status_code, 400)
+
+    def test_top(self):
+        self.assertLimits('/catalog/movie/top/', 250)
+
+    def test_similar(self):
+        movie = models.Movie.objects.first()
+        self.assertLimits(f'/catalog/movie/{movie.pk}/similar/', 50)
+
+    def test_birthdays(self):
+        self.assertLimits('/catalog/person/birthdays/', 50)
+
+    def test_recommendations(self):
+        self.assertLimits(f'/catalog/user/{self.user.pk}/recommendations/', 50)
+
+    def test_similar_unknown_movie(self):
+        for pk in (0, 'abc'):
+            with self.subTest(pk=pk):
+                self.assertEqual(self.anonymous.get(f'/catalog/movie/{pk}/similar/').status_code, 404)
+
+
+class TrainRecommendationsTests(CatalogTestCase):
+
+    def train(self, *args):
+        stdout = io.StringIO()
+        call_command('train_recommendations', *args, factors=4, iterations=2, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_incremental_converges(self):
+        self.train()
+        self.assertIn('Новых оценок нет', self.train('--incremental'))
+
+        # Оценки только у фильма без вектора: рекомендовать нечего, но повторно не пересчитывается
+        newcomer = models.User.objects.create_user('newcomer', 'newcomer@example.com', 'password')
+        models.Rating.objects.create(movie=models.Movie.objects.create(title='Новинка'), user=newcomer, rate=9)
+        self.assertIn('Пользователей для дообучения 1', self.train('--incremental'))
+        self.assertFalse(models.UserRecommendation.objects.filter(user=newcomer).exists())
+        self.assertIn('Новых оценок нет', self.train('--incremental'))
+
+        # Удаленная оценка тоже требует пересчета
+        models.Rating.objects.filter(user=self.user).first().delete()
+        self.assertIn('Пользователей для дообучения 1', self.train('--incremental'))
+        self.assertIn('Новых оценок нет', self.train('--incremental'))
+
+
+class BuildImageVariantsTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, IMAGE_VARIANT_WIDTHS=[16]))
+
+    def create_person(self, name, data):
+        person = models.Person(full_name=name)
+        person.photo.save(f'{name}.png', ContentFile(data))
+        return person
+
+    def test_corrupt_file_does_not_abort(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (32, 24), 'red').save(buffer, 'PNG')
+        corrupt = self.create_person('corrupt', b'not an image')
+        valid = self.create_person('valid', buffer.getvalue())
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('build_image_variants', workers=1, stdout=stdout, stderr=stderr)
+        self.assertIn(f'Person {corrupt.pk}: UnidentifiedImageError', stderr.getvalue())
+        valid.refresh_from_db()
+        self.assertEqual(set(valid.photo_variants['webp']), {'16'})
+        corrupt.refresh_from_db()
+        self.assertEqual(corrupt.photo_variants, {})
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = models.User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        cls.group = Group.objects.create(name='Редакторы')
+        cls.permission = Permission.objects.get(codename='change_movie')
+
+    def setUp(self):
+        cache.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_me(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/catalog/me/')
+        return response, len(queries)
+
+    def assertRefetched(self):
+        # Запрос после изменения читает токен с пользователем из БД, следующий - снова из кеша
+        response, queries = self.get_me()
+        self.assertEqual((response.status_code, queries), (200, 1))
+        self.assertEqual(self.get_me()[1], 0)
+        return response
+
+    def test_warm_requests_without_queries(self):
+        response, queries = self.get_me()
+        self.assertEqual((response.status_code, queries), (200, 1))
+        response, queries = self.get_me()
+        self.assertEqual(queries, 0)
+        self.assertEqual(response.data['username'], 'viewer')
+
+    def test_deactivation(self):
+        self.get_me()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_me()[0].status_code, 401)
+
+    def test_password_change(self):
+        self.get_me()
+        self.user.set_password('new password')
+        self.user.save()
+        self.assertRefetched()
+
+    def test_staff_change(self):
+        self.get_me()
+        self.user.is_staff = True
+        self.user.save()
+        self.assertTrue(self.assertRefetched().data['is_staff'])
+
+    def test_last_login_keeps_cache(self):
+        self.get_me()
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(self.get_me()[1], 0)
+
+    def test_logout(self):
+        self.get_me()
+        self.assertEqual(self.client.post('/catalog/logout/').status_code, 200)
+        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+        self.assertEqual(self.get_me()[0].status_code, 401)
+
+    def test_group_and_permission_changes(self):
+        changes = (
+            lambda: self.user.groups.add(self.group),
+            lambda: self.group.permissions.add(self.permission),
+            lambda: self.permission.group_set.clear(),
+            lambda: self.user.user_permissions.add(self.permission),
+            lambda: self.permission.user_set.remove(self.user),
+            lambda: self.group.user_set.clear(),
+            lambda: self.user.groups.add(self.group),
+            lambda: Group.objects.filter(pk=self.group.pk).delete(),
+        )
+        self.get_me()
+        for i, change in enumerate(changes):
+            with self.subTest(change=i):
+                change()
+                self.assertRefetched()
+
+
+@override_settings(TOP_CHART_MIN_VOTES=1)
+class TopChartMeanTests(CatalogTestCase):
+
+    def test_mean_survives_cache_eviction(self):
+        # Обновления позиций после вытеснения C из кеша используют C последней перестройки
+        charts.rebuild_top_charts(models.TopChartEntry, models.Movie)
+        mean = models.TopChartMean.objects.get().mean
+        movie = models.Movie.objects.first()
+        cache.clear()
+        models.Rating.objects.create(movie=movie, user=models.User.objects.get(username='critic'), rate=1)
+        movie.refresh_from_db()
+        self.assertNotEqual(charts.compute_global_mean(models.Movie), mean)
+        self.assertEqual(charts.get_global_mean(models.TopChartEntry, models.Movie), mean)
+        expected = charts.weighted_rating(movie.rating_sum, movie.rating_count, mean, 1)
+        scores = list(models.TopChartEntry.objects.filter(movie=movie).values_list('score', flat=True))
+        self.assertTrue(scores)
+        for score in scores:
+            self.assertAlmostEqual(score, expected)
+
+
+class ExportTests(CatalogTestCase):
+
+    def export(self, url, **params):
+        response = self.authenticated.get(f'{url}export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_row_counts_match_list(self):
+        critic = models.User.objects.get(username='critic').pk
+        cases = (
+            ('/catalog/movie/', {}),
+            ('/catalog/movie/', {'year': '2005'}),
+            ('/catalog/movie/', {'genre': 'Драма', 'sort': '-rate'}),
+            ('/catalog/rating/', {'user': critic}),
+            ('/catalog/rating/', {'rate': '7'}),
+            ('/catalog/review/', {'user': self.user.pk}),
+        )
+        for url, params in cases:
+            count = self.authenticated.get(url, params).data['count']
+            with self.subTest(url=url, params=params):
+                lines = self.export(url, output='ndjson', **params).splitlines()
+                self.assertEqual(len(lines), count)
+                rows = list(csv.reader(io.StringIO(self.export(url, output='csv', **params))))
+                self.assertEqual(len(rows) - 1, count)
+
+    def test_ndjson_rows_match_list(self):
+        rows = [json.loads(line) for line in self.export('/catalog/movie/', year='2005').splitlines()]
+        results = self.authenticated.get('/catalog/movie/', {'year': '2005'}).data['results']
+        self.assertEqual(rows, json.loads(JSONRenderer().render(results)))
+
+    def test_fields(self):
+        rows = list(csv.reader(io.StringIO(self.export('/catalog/movie/', output='csv', fields='id,title'))))
+        self.assertEqual(rows[0], ['id', 'title'])
+        self.assertEqual(len(rows[1]), 2)
+
+    def test_unknown_output(self):
+        response = self.authenticated.get('/catalog/movie/export/', {'output': 'xml'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('output', response.data)
+
+
+class ImportCatalogTests(TestCase):
+
+    def import_rows(self, *rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8') as file:
+            file.write('\n'.join(json.dumps(row, ensure_ascii=False) for row in rows))
+            file.flush()
+            call_command('import_catalog', file.name, batch_size=1, stdout=io.StringIO())
+
+    def test_import(self):
+        self.import_rows({
+            'title': 'Фильм', 'type': 'Сериал', 'release_date': '2001-02-03',
+            'genres': ['Драма'], 'countries': ['Россия'], 'actors': ['Актер'], 'directors': ['Режиссер'],
+        })
+        movie = models.Movie.objects.get(title='Фильм')
+        self.assertEqual(movie.type, models.Movie.Type.SERIES)
+        self.assertEqual(list(movie.genres.values_list('name', flat=True)), ['Драма'])
+        self.assertEqual(movie.professions.count(), 2)
+
+    def test_list_field_must_be_list(self):
+        with self.assertRaisesMessage(CommandError, 'Строка 1: genres должен быть списком строк'):
+            self.import_rows({'title': 'Фильм', 'genres': 'Драма'})
+        self.assertFalse(models.Genre.objects.exists())
+
+    def test_unknown_type(self):
+        with self.assertRaisesMessage(CommandError, "Строка 1: неизвестный type 'Мультфильм'"):
+            self.import_rows({'title': 'Фильм', 'type': 'Мультфильм'})
+
+    def test_versions_bumped_after_error(self):
+        # Первая пачка сохранена, вторая с ошибкой: кеши не должны отдавать данные до импорта
+        version = get_version('movie')
+        with self.assertRaisesMessage(CommandError, 'Строка 2'):
+            self.import_rows({'title': 'Первый'}, {'title': 'Второй', 'countries': [1]})
+        self.assertTrue(models.Movie.objects.filter(title='Первый').exists())
+        self.assertNotEqual(get_version('movie'), version)
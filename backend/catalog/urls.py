@@ -22,6 +22,8 @@ urlpatterns = [
     path('logout/', views.LogoutView.as_view()),
 
     path('me/', views.me),
+    path('autocomplete/', views.autocomplete),
+    path('cache-stats/', views.cache_stats),
 
     path('admin/review/<int:review_id>/pdf/', views.admin_review_pdf, name='admin_review_pdf'),
 ] + router.urls
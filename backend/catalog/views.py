@@ -8,20 +8,33 @@ from django.template.loader import render_to_string
 from django.http import HttpResponse
 from django.core.cache import cache
 from django.db.models import Prefetch
+from rest_framework import generics
 from rest_framework.authtoken.models import Token
-from rest_framework.decorators import action, api_view
-from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, IsAdminUser, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.generics import CreateAPIView
 #import weasyprint
+from itertools import chain
+from operator import attrgetter
 from urllib.parse import quote
 
 from catalog.models import Movie
-from utils import querysets
+from utils import charts, pagination, querysets
+from utils.autocomplete import PrefixIndex
+from utils.cache import get_versions, make_key, normalize_query
+from utils.export import ExportMixin
+from utils.fastlist import FastField, FastListMixin, file_url, media_url, url_pattern
+from utils.images import build_srcset
+from utils.lookups import VersionedLookup
 from utils.serializers import get_sort_dict
+from utils.views import (
+    CachedResponseMixin, ConditionalGetMixin, SparseFieldsetsMixin, conditional_data_response,
+    get_response_cache_stats, parse_limit_param,
+)
 from catalog import models, serializers, filters, permissions
 
 
@@ -48,6 +61,46 @@ def me(request):
     return Response({"user": None})
 
 
+def build_autocomplete_index():
+    return PrefixIndex(chain(
+        (('movie', pk, title) for pk, title in models.Movie.objects.values_list('id', 'title').iterator()),
+        (('person', pk, name) for pk, name in models.Person.objects.values_list('id', 'full_name').iterator()),
+        (('genre', pk, name) for pk, name in models.Genre.objects.values_list('id', 'name')),
+    ))
+
+
+# Сортировка всех названий каталога долгая: после изменений индекс пересобирается в фоне
+autocomplete_index = VersionedLookup(['movie', 'person', 'genre'], build_autocomplete_index, background=True)
+
+
+POSTER_POOL_SIZE = 8
+
+
+def build_poster_pools():
+    return {
+        'genres': querysets.get_poster_pools(models.Movie.genres.through, 'genre_id', POSTER_POOL_SIZE),
+        'countries': querysets.get_poster_pools(models.Movie.countries.through, 'country_id', POSTER_POOL_SIZE),
+    }
+
+
+# Постеры для обложек жанров и стран, пересчитываются при изменении фильмов
+poster_pools = VersionedLookup(['movie', 'genre', 'country'], build_poster_pools)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def autocomplete(request):
+    limit = parse_limit_param(request.query_params, 10, 50)
+    query = request.query_params.get('q', '')
+    return Response(autocomplete_index.get().search(query, limit))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    return Response(get_response_cache_stats(['movie', 'person', 'genre']))
+
+
 class SignUpView(CreateAPIView):
     permission_classes = [permissions.IsUnauthenticated]
     serializer_class = serializers.SignUpSerializer
@@ -68,12 +121,9 @@ class LoginView(APIView):
         if not user.check_password(password):
             raise AuthenticationFailed('Incorrect password.')
         login(request, user)
-        if Token.objects.filter(user=user).exists():
-            token = Token.objects.get(user=user).key
-        else:
-            token = Token.objects.create(user=user)
+        token, _ = Token.objects.get_or_create(user=user)
 
-        return Response({"token": token})
+        return Response({"token": token.key})
 
 
 class LogoutView(APIView):
@@ -81,22 +131,47 @@ class LogoutView(APIView):
 
     @staticmethod
     def post(request):
+        # Удаление токена сбрасывает его в кеше аутентификации всех процессов
+        if isinstance(request.auth, Token):
+            request.auth.delete()
         logout(request)
         return Response({"success": "User logged out."})
 
 
-class UserViewSet(ModelViewSet):
+class UserViewSet(ConditionalGetMixin, SparseFieldsetsMixin, ModelViewSet):
+    response_cache_dependencies = ['user', 'rating', 'review']
     queryset = models.User.objects.all()
     filterset_class = filters.UserFilter
 
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'destroy']:
             return [permissions.IsUserOrAdminOrReadOnly()]
+        if self.action == 'recommendations':
+            return [IsAuthenticated()]
         return [permissions.IsAdminUserOrReadOnly()]
 
     def get_queryset(self):
         qs = super().get_queryset()
-        return querysets.annotate_user_queryset(qs)
+        counts = [name for name in querysets.USER_COUNTS if self.is_field_requested(name)]
+        return querysets.annotate_user_queryset(qs, counts)
+
+    @action(detail=True, methods=['get'])
+    def recommendations(self, request, pk=None):
+        if str(request.user.pk) != pk and not request.user.is_staff:
+            raise PermissionDenied()
+        limit = parse_limit_param(request.query_params, 20, 50)
+
+        # Списки заранее рассчитаны командой train_recommendations; фильмы,
+        # оцененные после расчета, отбрасываются
+        unseen = models.Movie.objects.exclude(ratings__user_id=pk)
+        unseen = querysets.prefetch_user_ratings(unseen, request.user, models.Rating.objects.all())
+        movies = list(querysets.annotate_movie_queryset(unseen.filter(recommended_to__user_id=pk))
+                      .order_by('-recommended_to__score')[:limit])
+        if not movies:
+            # Холодный старт: лучшие по средней оценке
+            movies = list(querysets.annotate_movie_queryset(unseen.filter(rating_avg__isnull=False))[:limit])
+        serializer = serializers.MovieListSerializer(movies, many=True, context={'request': request})
+        return Response(serializer.data)
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -126,17 +201,42 @@ class UserViewSet(ModelViewSet):
             }
             cache.set(cache_key, cached_filters, 60 * 60)
 
-        return Response(cached_filters)
+        return conditional_data_response(request, cached_filters)
 
 
-class MovieViewSet(ModelViewSet):
+class MovieViewSet(ConditionalGetMixin, CachedResponseMixin, SparseFieldsetsMixin, ExportMixin, FastListMixin,
+                   ModelViewSet):
     permission_classes = [permissions.IsAdminUserOrReadOnly]
-    queryset = models.Movie.objects.prefetch_related('genres', 'countries').all()
+    response_cache_dependencies = ['movie', 'rating', 'genre', 'country', 'person', 'profession']
+    facet_ignored_params = ('sort', 'page', 'pagination', 'cursor', 'fields', 'omit')
+    pagination_class = pagination.CursorOrPageNumberPagination
+    queryset = models.Movie.objects.all()
     filterset_class = filters.MovieFilter
+    fast_list = True
+
+    def get_fast_list_fields(self):
+        # Поля MovieListSerializer из столбцов фильма, оценки пользователя - одним запросом на страницу
+        request = self.request
+        storage = models.Movie._meta.get_field('poster').storage
+        if request.user.is_authenticated:
+            user_actions = FastField('id', load=lambda movie_ids: querysets.get_user_actions(
+                request.user, movie_ids, models.Rating.objects.all()))
+        else:
+            user_actions = FastField(convert=lambda: None)
+        url = media_url(storage, request)
+        return {
+            'poster': FastField('poster', convert=file_url(storage, request)),
+            'poster_srcset': FastField('poster_variants', convert=lambda variants: build_srcset(
+                storage, variants, request, url=url)),
+            'rate': FastField('_rate'),
+            'user_actions': user_actions,
+            'release_year': FastField('release_date', convert=attrgetter('year')),
+            'url': FastField('id', convert=url_pattern('catalog:movie-detail')),
+        }
 
     def get_serializer_class(self):
         match self.action:
-            case 'list':
+            case 'list' | 'export':
                 return serializers.MovieListSerializer
             case 'retrieve':
                 return serializers.MovieDetailSerializer
@@ -144,20 +244,24 @@ class MovieViewSet(ModelViewSet):
 
     def get_queryset(self):
         qs = super().get_queryset()
+        qs = qs.prefetch_related(*[name for name in ('genres', 'countries') if self.is_field_requested(name)])
+        if self.is_field_requested('user_actions'):
+            qs = querysets.prefetch_user_ratings(qs, self.request.user, models.Rating.objects.all())
         return querysets.annotate_movie_queryset(qs)
 
     @action(detail=False, methods=['get'])
     def filter(self, request):
-        cache_key = 'movie_available_filters'
+        # Годы, жанры и страны меняются вместе с данными, поэтому версии входят в ключ
+        cache_key = make_key('movie_available_filters', sorted(get_versions('movie', 'genre', 'country').items()))
         cached_filters = cache.get(cache_key)
 
         if not cached_filters:
-            years = (models.Movie.objects
-                     .annotate(year=ExtractYear('release_date'))
-                     .values_list('year', flat=True)
-                     .distinct().order_by('-year'))
-            genres = models.Genre.objects.values_list('name', flat=True)
-            countries = models.Country.objects.values_list('name', flat=True)
+            years = list(models.Movie.objects
+                         .annotate(year=ExtractYear('release_date'))
+                         .values_list('year', flat=True)
+                         .distinct().order_by('-year'))
+            genres = list(models.Genre.objects.values_list('name', flat=True))
+            countries = list(models.Country.objects.values_list('name', flat=True))
             types = [choice[0] for choice in models.Movie.Type.choices]
 
             sort = get_sort_dict([
@@ -178,7 +282,72 @@ class MovieViewSet(ModelViewSet):
             }
             cache.set(cache_key, cached_filters, 60 * 60)
 
-        return Response(cached_filters)
+        return conditional_data_response(request, cached_filters)
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        versions = get_versions('movie', 'genre', 'country')
+        cache_key = make_key(
+            'movie_facets',
+            sorted(versions.items()),
+            normalize_query(request.query_params, exclude=self.facet_ignored_params),
+        )
+        facets = cache.get(cache_key)
+
+        if facets is None:
+            facets = querysets.count_movie_facets(self.get_facet_queryset)
+            cache.set(cache_key, facets, 60 * 60)
+
+        return Response(facets)
+
+    def get_facet_queryset(self, facet):
+        params = self.request.query_params.copy()
+        for name in (facet, *self.facet_ignored_params):
+            params.pop(name, None)
+        filterset = filters.MovieFilter(params, queryset=models.Movie.objects.all(), request=self.request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        return filterset.qs
+
+    @action(detail=False, methods=['get'])
+    def top(self, request):
+        # Материализованные топы (utils.charts): одна выборка по индексу (chart, -score),
+        # таблица оценок при чтении не используется
+        lookup = filters.movie_lookup.get()
+        params = {name: request.query_params.get(name) for name in ('type', 'genre', 'country')}
+        params = {name: value for name, value in params.items() if value}
+        if len(params) > 1:
+            raise ValidationError({'detail': 'Допускается только один из параметров type, genre, country.'})
+        limit = parse_limit_param(request.query_params, 50, 250)
+
+        chart = charts.chart_key()
+        if 'type' in params:
+            if params['type'] not in models.Movie.Type.values:
+                raise ValidationError({'type': 'Неизвестный тип.'})
+            chart = charts.chart_key('type', params['type'])
+        for name, kind in (('genre', 'genres'), ('country', 'countries')):
+            if name in params:
+                if params[name] not in lookup[kind]:
+                    raise ValidationError({name: 'Неизвестное значение.'})
+                chart = charts.chart_key(name, lookup[kind][params[name]])
+
+        movies = models.Movie.objects.filter(chart_entries__chart=chart)
+        movies = querysets.prefetch_user_ratings(movies, request.user, models.Rating.objects.all())
+        movies = querysets.annotate_movie_queryset(movies).order_by('-chart_entries__score', 'id')[:limit]
+        serializer = serializers.MovieListSerializer(movies, many=True, context={'request': request})
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        # Соседи заранее рассчитаны командой build_movie_similarity,
+        # выборка идет по индексу (movie, -score)
+        movie = generics.get_object_or_404(models.Movie.objects.only('id'), pk=pk)
+        limit = parse_limit_param(request.query_params, 10, 50)
+        movies = models.Movie.objects.filter(similar_to__movie_id=movie.pk)
+        movies = querysets.prefetch_user_ratings(movies, request.user, models.Rating.objects.all())
+        movies = querysets.annotate_movie_queryset(movies).order_by('-similar_to__score')[:limit]
+        serializer = serializers.MovieListSerializer(movies, many=True, context={'request': request})
+        return Response(serializer.data)
 
     @action(detail=True, methods=['get'])
     def clear(self, request, pk=None):
@@ -190,10 +359,22 @@ class MovieViewSet(ModelViewSet):
             return Response({'detail': 'Movie not found'})
 
 
-class ReviewViewSet(ModelViewSet):
-    queryset = models.Review.objects.select_related('user', 'movie').all()
+class ReviewViewSet(ConditionalGetMixin, SparseFieldsetsMixin, ExportMixin, FastListMixin, ModelViewSet):
+    response_cache_dependencies = ['review', 'user', 'movie']
+    pagination_class = pagination.CursorOrPageNumberPagination
+    queryset = models.Review.objects.all()
     serializer_class = serializers.ReviewSerializer
     filterset_class = filters.ReviewFilter
+    fast_list = True
+    fast_list_fields = {
+        'movie': FastField('movie_id', 'movie__title', keys=('id', 'title')),
+        'user': FastField('user_id', 'user__username', keys=('id', 'username')),
+    }
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        relations = [name for name in ('user', 'movie') if self.is_field_requested(name)]
+        return qs.select_related(*relations) if relations else qs
 
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'destroy']:
@@ -201,7 +382,7 @@ class ReviewViewSet(ModelViewSet):
         return [IsAuthenticatedOrReadOnly()]
 
     def get_serializer_class(self):
-        if self.action == 'list':
+        if self.action in ('list', 'export'):
             return serializers.ReviewListSerializer
         return serializers.ReviewSerializer
 
@@ -226,12 +407,24 @@ class ReviewViewSet(ModelViewSet):
             }
             cache.set(cache_key, cached_filters, 60 * 60)
 
-        return Response(cached_filters)
+        return conditional_data_response(request, cached_filters)
 
 
-class RatingViewSet(ModelViewSet):
-    queryset = models.Rating.objects.select_related('user', 'movie').all()
+class RatingViewSet(ConditionalGetMixin, SparseFieldsetsMixin, ExportMixin, FastListMixin, ModelViewSet):
+    response_cache_dependencies = ['rating', 'user', 'movie']
+    pagination_class = pagination.CursorOrPageNumberPagination
+    queryset = models.Rating.objects.all()
     filterset_class = filters.RatingFilter
+    fast_list = True
+    fast_list_fields = {
+        'movie': FastField('movie_id', 'movie__title', keys=('id', 'title')),
+        'user': FastField('user_id', 'user__username', keys=('id', 'username')),
+    }
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        relations = [name for name in ('user', 'movie') if self.is_field_requested(name)]
+        return qs.select_related(*relations) if relations else qs
 
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'destroy']:
@@ -239,13 +432,13 @@ class RatingViewSet(ModelViewSet):
         return [IsAuthenticatedOrReadOnly()]
 
     def get_serializer_class(self):
-        if self.action == 'list':
+        if self.action in ('list', 'export'):
             return serializers.RatingListSerializer
         return serializers.RatingSerializer
 
     @action(detail=False, methods=['get'])
     def filter(self, request):
-        cache_key = 'review_available_filters'
+        cache_key = 'rating_available_filters'
         cached_filters = cache.get(cache_key)
 
         if not cached_filters:
@@ -264,28 +457,53 @@ class RatingViewSet(ModelViewSet):
             }
             cache.set(cache_key, cached_filters, 60 * 60)
 
-        return Response(cached_filters)
+        return conditional_data_response(request, cached_filters)
 
 
-class PersonViewSet(ModelViewSet):
+class PersonViewSet(ConditionalGetMixin, CachedResponseMixin, SparseFieldsetsMixin, ModelViewSet):
     permission_classes = [permissions.IsAdminUserOrReadOnly]
     queryset = models.Person.objects.all()
     filterset_class = filters.PersonFilter
+    response_cache_dependencies = ['person', 'profession', 'movie', 'rating']
 
     def get_queryset(self):
-        qs = super().get_queryset()
-        annotated_movies = querysets.annotate_movie_queryset(models.Movie.objects.all())
-        pref = qs.prefetch_related(Prefetch('professions__movie', queryset=annotated_movies))
-        return querysets.annotate_person_queryset(pref)
+        # Полный текст биографии нужен только индексу поиска
+        qs = super().get_queryset().defer('biography_text')
+        # Фильмы с оценками нужны только карточке; в списке - топ-5 одним запросом на страницу
+        if self.action == 'retrieve' and self.is_field_requested('professions'):
+            annotated_movies = querysets.annotate_movie_queryset(models.Movie.objects.all())
+            qs = qs.prefetch_related(Prefetch('professions__movie', queryset=annotated_movies))
+        elif self.action == 'list' and self.is_field_requested('top_5_movies'):
+            qs = querysets.prefetch_top_movies(qs, models.Profession.objects.all())
+        return qs
+
+    def get_response_versions(self):
+        versions = super().get_response_versions()
+        # Порядок sort=birthday зависит от текущей даты: ETag и кеш ответа меняются в полночь
+        sort = self.request.query_params.get('sort', '')
+        if 'birthday' in [param.strip().lstrip('-') for param in sort.split(',')]:
+            versions['birthday'] = querysets.birthday_day_version()
+        return versions
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return serializers.PersonDetailSerializer
         return serializers.PersonListSerializer
 
+    @action(detail=False, methods=['get'])
+    def birthdays(self, request):
+        # Ближайшие дни рождения по индексу birthday_key, после конца года - с начала года
+        limit = parse_limit_param(request.query_params, 10, 50)
+        queryset = querysets.prefetch_top_movies(
+            models.Person.objects.defer('biography_text'), models.Profession.objects.all()
+        )
+        persons = querysets.get_upcoming_birthdays(queryset, limit)
+        serializer = self.get_serializer(persons, many=True)
+        return Response(serializer.data)
+
     @action(detail=False, methods=['get'])
     def filter(self, request):
-        cache_key = 'review_available_filters'
+        cache_key = 'person_available_filters'
         cached_filters = cache.get(cache_key)
 
         if not cached_filters:
@@ -304,13 +522,24 @@ class PersonViewSet(ModelViewSet):
             }
             cache.set(cache_key, cached_filters, 60 * 60)
 
-        return Response(cached_filters)
+        return conditional_data_response(request, cached_filters)
 
 
-class ProfessionViewSet(ModelViewSet):
+class ProfessionViewSet(ConditionalGetMixin, SparseFieldsetsMixin, FastListMixin, ModelViewSet):
+    response_cache_dependencies = ['profession', 'person', 'movie']
     # permission_classes = [IsAdminUser]
-    queryset = models.Profession.objects.select_related('person', 'movie').all()
+    queryset = models.Profession.objects.all()
     filterset_class = filters.ProfessionFilter
+    fast_list = True
+    fast_list_fields = {
+        'movie': FastField('movie_id', 'movie__title', keys=('id', 'title')),
+        'person': FastField('person_id', 'person__full_name', keys=('id', 'full_name')),
+    }
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        relations = [name for name in ('person', 'movie') if self.is_field_requested(name)]
+        return qs.select_related(*relations) if relations else qs
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -318,20 +547,29 @@ class ProfessionViewSet(ModelViewSet):
         return serializers.ProfessionSerializer
 
 
-class GenreViewSet(ModelViewSet):
+class GenreViewSet(ConditionalGetMixin, CachedResponseMixin, SparseFieldsetsMixin, ModelViewSet):
     permission_classes = [permissions.IsAdminUserOrReadOnly]
+    response_cache_dependencies = ['genre', 'movie']
     queryset = models.Genre.objects.all()
     filterset_class = filters.GenreFilter
 
     def get_queryset(self):
         qs = super().get_queryset()
-        return querysets.annotate_genre_queryset(qs)
+        if self.is_field_requested('movies_count'):
+            qs = querysets.annotate_genre_queryset(qs)
+        return qs
 
     def get_serializer_class(self):
         if self.action == 'list':
             return serializers.GenreListSerializer
         return serializers.GenreSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'list' and self.is_field_requested('random_poster'):
+            context['poster_pool'] = poster_pools.get()['genres']
+        return context
+
     @action(detail=False, methods=['get'])
     def filter(self, request):
         cache_key = 'genre_available_filters'
@@ -351,15 +589,28 @@ class GenreViewSet(ModelViewSet):
             }
             cache.set(cache_key, cached_filters, 60 * 60)
 
-        return Response(cached_filters)
+        return conditional_data_response(request, cached_filters)
 
 
-class CountryViewSet(ModelViewSet):
+class CountryViewSet(ConditionalGetMixin, SparseFieldsetsMixin, ModelViewSet):
+    response_cache_dependencies = ['country', 'movie']
     permission_classes = [permissions.IsAdminUserOrReadOnly]
     queryset = models.Country.objects.all()
     filterset_class = filters.CountryFilter
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.is_field_requested('movies_count'):
+            qs = querysets.annotate_country_queryset(qs)
+        return qs
+
     def get_serializer_class(self):
         if self.action == 'list':
             return serializers.CountryListSerializer
         return serializers.CountrySerializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'list' and self.is_field_requested('random_poster'):
+            context['poster_pool'] = poster_pools.get()['countries']
+        return context
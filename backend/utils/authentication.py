@@ -0,0 +1,84 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from utils.cache import bump_version, get_version, make_key
+
+
+def auth_version_name(user_id):
+    return f'auth:{user_id}'
+
+
+def invalidate_user_tokens(*user_ids):
+    # Новая версия делает недействительными закешированные токены пользователей во всех процессах
+    if user_ids:
+        bump_version(*map(auth_version_name, user_ids))
+
+
+class TokenLRU:
+    # Ограниченный LRU на процесс: ключ токена -> (срок, запись общего кеша)
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.TOKEN_AUTH_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+local_tokens = TokenLRU()
+
+
+# TokenAuthentication без запроса к БД на каждый запрос. Токен с пользователем
+# ищется в LRU процесса, затем в общем кеше; запись действительна, пока не
+# изменилась версия auth:<id пользователя> (см. utils.cache). Версию меняют
+# сигналы при изменении и удалении пользователя (пароль, is_active, is_staff),
+# его групп и разрешений и токена (выход), см. catalog.signals. Проверка - одно обращение к кешу.
+# Объекты хранятся в pickle: каждый запрос получает свою копию пользователя.
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        now = time.monotonic()
+        local = local_tokens.get(key)
+        entry = local[1] if local is not None and local[0] > now else None
+        if entry is None:
+            entry = cache.get(make_key('auth_token', key))
+            if entry is not None:
+                local_tokens.set(key, (now + settings.TOKEN_AUTH_CACHE_TIMEOUT, entry))
+
+        if entry is not None:
+            user_id, version, data = entry
+            if version == get_version(auth_version_name(user_id)):
+                token = pickle.loads(data)
+                return token.user, token
+            local_tokens.pop(key)
+
+        started = time.time_ns()
+        user, token = super().authenticate_credentials(key)
+        version = get_version(auth_version_name(user.pk))
+        # Версии - время изменения: более поздняя значит, что пользователь мог
+        # измениться во время запроса к БД, и прочитанное не кешируется
+        if version < started:
+            entry = (user.pk, version, pickle.dumps(token))
+            cache.set(make_key('auth_token', key), entry, settings.TOKEN_AUTH_CACHE_TIMEOUT)
+            local_tokens.set(key, (time.monotonic() + settings.TOKEN_AUTH_CACHE_TIMEOUT, entry))
+        return user, token
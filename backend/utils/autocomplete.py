@@ -0,0 +1,54 @@
+import bisect
+import re
+
+
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(value):
+    return value.lower().replace('ё', 'е')
+
+
+# Префиксный индекс для подсказок: отсортированный список слов всех названий
+# и бинарный поиск по нему. Запрос из нескольких слов ищется по самому длинному
+# слову, остальные должны быть префиксами других слов того же названия.
+class PrefixIndex:
+    # Сколько кандидатов просматривается до ранжирования
+    scan_factor = 20
+
+    def __init__(self, entries):
+        self.entries = []
+        words = []
+        for kind, pk, label in entries:
+            entry_words = WORD_RE.findall(normalize(label))
+            index = len(self.entries)
+            self.entries.append((kind, pk, label, entry_words))
+            words += [(word, position, index) for position, word in enumerate(entry_words)]
+        words.sort()
+        self.words = [word for word, _, _ in words]
+        self.positions = [(position, index) for _, position, index in words]
+
+    def search(self, query, limit=10):
+        tokens = WORD_RE.findall(normalize(query))
+        if not tokens:
+            return []
+        prefix = max(tokens, key=len)
+        others = list(tokens)
+        others.remove(prefix)
+
+        candidates = {}
+        start = bisect.bisect_left(self.words, prefix)
+        for i in range(start, len(self.words)):
+            if not self.words[i].startswith(prefix) or len(candidates) >= limit * self.scan_factor:
+                break
+            position, index = self.positions[i]
+            kind, pk, label, entry_words = self.entries[index]
+            if all(any(word.startswith(token) for word in entry_words) for token in others):
+                candidates[index] = min(position, candidates.get(index, position))
+
+        # Выше совпадения с начала названия, затем более короткие названия
+        ranked = sorted(candidates, key=lambda index: (candidates[index] > 0, len(self.entries[index][2])))
+        return [
+            {'type': self.entries[index][0], 'id': self.entries[index][1], 'label': self.entries[index][2]}
+            for index in ranked[:limit]
+        ]
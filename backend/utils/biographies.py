@@ -0,0 +1,27 @@
+TEXT_EXTENSIONS = ('.txt', '.srt')
+EXCERPT_LENGTH = 100
+
+
+def extract_biography(name, data):
+    # (текст, отрывок для списков); у нетекстовых файлов текста нет
+    if not name.lower().endswith(TEXT_EXTENSIONS):
+        return '', ''
+    text = data.decode('utf-8-sig', errors='replace')
+    return text, text[:EXCERPT_LENGTH] + '…' if len(text) > EXCERPT_LENGTH else text
+
+
+def read_upload(field_file):
+    # Загруженный, но еще не сохраненный файл: читается до сохранения в хранилище,
+    # позиция возвращается в начало, чтобы хранилище записало файл целиком
+    upload = field_file.file
+    upload.seek(0)
+    data = upload.read()
+    upload.seek(0)
+    return extract_biography(field_file.name, data)
+
+
+def read_stored(storage, name):
+    if not name.lower().endswith(TEXT_EXTENSIONS):
+        return '', ''
+    with storage.open(name, 'rb') as file:
+        return extract_biography(name, file.read())
@@ -0,0 +1,48 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+
+VERSION_KEY = 'version:{}'
+
+
+# Версии данных: меняются сигналами при любой записи в модель
+# (см. catalog.signals) и входят в ключи кешей, зависящих от этих данных.
+# Значение - время последнего изменения в наносекундах.
+# Версии хранятся в кеше default, поэтому он должен быть общим для всех
+# процессов (settings.CACHES): с LocMemCache запись в одном воркере не меняет
+# версии в остальных, и их кеши и ETag устаревают.
+def get_versions(*names):
+    keys = {VERSION_KEY.format(name): name for name in names}
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    for key, version in missing.items():
+        # Версия вытеснена из кеша или еще не создавалась: новая версия
+        # гарантирует, что старые записи больше не будут найдены
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+        versions[key] = version
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def get_version(name):
+    return get_versions(name)[name]
+
+
+def bump_version(*names):
+    now = time.time_ns()
+    cache.set_many({VERSION_KEY.format(name): now for name in names}, None)
+
+
+def normalize_query(query_params, exclude=()):
+    return '&'.join(
+        f'{key}={",".join(sorted(query_params.getlist(key)))}'
+        for key in sorted(query_params)
+        if key not in exclude
+    )
+
+
+def make_key(prefix, *parts):
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'{prefix}:{digest}'
@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+
+
+GLOBAL_MEAN_KEY = 'top_charts:mean'
+
+
+def chart_key(kind=None, value=None):
+    return 'all' if kind is None else f'{kind}:{value}'
+
+
+def weighted_rating(rating_sum, rating_count, mean, min_votes):
+    # WR = v / (v + m) * R + m / (v + m) * C = (сумма + m * C) / (v + m)
+    return (rating_sum + min_votes * mean) / (rating_count + min_votes)
+
+
+def get_mean_model(entry_model):
+    # Строка с C хранится рядом с топами; в состоянии миграций до ее создания модели нет
+    try:
+        return entry_model._meta.apps.get_model(entry_model._meta.app_label, 'TopChartMean')
+    except LookupError:
+        return None
+
+
+def get_global_mean(entry_model, movie_model):
+    # Средняя оценка по всем фильмам (C), с которой посчитаны позиции топов.
+    # Обновляется только полной перестройкой, чтобы одна новая оценка не меняла
+    # все позиции; в кеше - копия значения из БД
+    mean = cache.get(GLOBAL_MEAN_KEY)
+    if mean is None:
+        mean_model = get_mean_model(entry_model)
+        if mean_model is not None:
+            mean = mean_model.objects.values_list('mean', flat=True).first()
+        if mean is None:
+            mean = set_global_mean(entry_model, compute_global_mean(movie_model))
+        else:
+            cache.set(GLOBAL_MEAN_KEY, mean, None)
+    return mean
+
+
+def compute_global_mean(movie_model):
+    totals = movie_model.objects.aggregate(total=Sum('rating_sum'), count=Sum('rating_count'))
+    return totals['total'] / totals['count'] if totals['count'] else 0.0
+
+
+def set_global_mean(entry_model, mean):
+    mean_model = get_mean_model(entry_model)
+    if mean_model is not None:
+        mean_model.objects.update_or_create(pk=1, defaults={'mean': mean})
+    # Кеш обновляется после фиксации вместе с позициями, посчитанными с этим C
+    transaction.on_commit(lambda: cache.set(GLOBAL_MEAN_KEY, mean, None))
+    return mean
+
+
+def movie_charts(movie_model, movie_ids):
+    charts = {}
+    for movie_id, movie_type in movie_model.objects.filter(pk__in=movie_ids).values_list('id', 'type'):
+        charts[movie_id] = [chart_key()]
+        if movie_type is not None:
+            charts[movie_id].append(chart_key('type', movie_type))
+    for through, field, kind in ((movie_model.genres.through, 'genre_id', 'genre'),
+                                 (movie_model.countries.through, 'country_id', 'country')):
+        for movie_id, value in through.objects.filter(movie_id__in=charts).values_list('movie_id', field):
+            charts[movie_id].append(chart_key(kind, value))
+    return charts
+
+
+def rebuild_movie_entries(entry_model, movie_model, movie_ids):
+    # Полный пересчет позиций фильмов: нужен при смене типа, жанров или стран
+    min_votes = settings.TOP_CHART_MIN_VOTES
+    mean = get_global_mean(entry_model, movie_model)
+    scores = {
+        movie_id: weighted_rating(rating_sum, rating_count, mean, min_votes)
+        for movie_id, rating_sum, rating_count in movie_model.objects
+        .filter(pk__in=movie_ids, rating_count__gte=min_votes)
+        .values_list('id', 'rating_sum', 'rating_count')
+    }
+    with transaction.atomic():
+        entry_model.objects.filter(movie_id__in=movie_ids).delete()
+        entry_model.objects.bulk_create([
+            entry_model(chart=chart, movie_id=movie_id, score=scores[movie_id])
+            for movie_id, charts in movie_charts(movie_model, scores).items()
+            for chart in charts
+        ])
+
+
+def refresh_movie_scores(entry_model, movie_model, movie_ids):
+    # После новой оценки меняется только балл фильма: обычно это один UPDATE.
+    # Фильм входит в топы, набрав TOP_CHART_MIN_VOTES оценок, и выходит из них,
+    # если оценок стало меньше
+    min_votes = settings.TOP_CHART_MIN_VOTES
+    mean = get_global_mean(entry_model, movie_model)
+    rows = movie_model.objects.filter(pk__in=movie_ids).values_list('id', 'rating_sum', 'rating_count')
+    for movie_id, rating_sum, rating_count in rows:
+        entries = entry_model.objects.filter(movie_id=movie_id)
+        if rating_count < min_votes:
+            entries.delete()
+        elif not entries.update(score=weighted_rating(rating_sum, rating_count, mean, min_votes)):
+            rebuild_movie_entries(entry_model, movie_model, [movie_id])
+
+
+def rebuild_top_charts(entry_model, movie_model):
+    # Полная перестройка всех топов запросами INSERT ... SELECT, без загрузки фильмов в память
+    min_votes = settings.TOP_CHART_MIN_VOTES
+    mean = compute_global_mean(movie_model)
+    quote = connection.ops.quote_name
+    movie = quote(movie_model._meta.db_table)
+    score = f'({movie}.{quote("rating_sum")} + %s) / ({movie}.{quote("rating_count")} + %s)'
+    eligible = f'{movie}.{quote("rating_count")} >= %s'
+    insert = 'INSERT INTO {} ({}, {}, {}) '.format(
+        quote(entry_model._meta.db_table), quote('chart'), quote('movie_id'), quote('score')
+    )
+    queries = [
+        (f"SELECT %s, {movie}.{quote('id')}, {score} FROM {movie} WHERE {eligible}", [chart_key()]),
+        (f"SELECT %s || {movie}.{quote('type')}, {movie}.{quote('id')}, {score} FROM {movie} "
+         f"WHERE {eligible} AND {movie}.{quote('type')} IS NOT NULL", ['type:']),
+    ]
+    for through, field, kind in ((movie_model.genres.through, 'genre_id', 'genre'),
+                                 (movie_model.countries.through, 'country_id', 'country')):
+        table = quote(through._meta.db_table)
+        queries.append((
+            f"SELECT %s || {table}.{quote(field)}, {movie}.{quote('id')}, {score} FROM {movie} "
+            f"INNER JOIN {table} ON {table}.{quote('movie_id')} = {movie}.{quote('id')} WHERE {eligible}",
+            [f'{kind}:'],
+        ))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        entry_model.objects.all().delete()
+        for select, params in queries:
+            cursor.execute(insert + select, params + [min_votes * mean, min_votes, min_votes])
+        set_global_mean(entry_model, mean)
+    return entry_model.objects.count()
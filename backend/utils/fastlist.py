@@ -0,0 +1,211 @@
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
+from django.utils.encoding import filepath_to_uri
+from rest_framework import ISO_8601, fields
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from utils.pagination import CursorOrPageNumberPagination
+from utils.renderers import FastJSONRenderer
+
+
+# Поля модели, значения которых из values_list уже совпадают с выводом сериализатора
+PLAIN_FIELDS = (fields.IntegerField, fields.FloatField, fields.CharField, fields.BooleanField,
+                fields.ChoiceField, fields.ReadOnlyField)
+# Поля, для которых вызывается to_representation самого поля сериализатора
+CONVERTED_FIELDS = (fields.DateTimeField, fields.DateField)
+
+_factories = {}
+
+
+class FastField:
+    # Поле быстрого списка: столбцы values_list и способ получить из них значение.
+    # Без параметров - значение первого столбца; keys - вложенный словарь
+    # {key: столбец}; convert(*значения) - преобразование (без столбцов - константа);
+    # load(значения первого столбца на странице) возвращает словарь, из которого
+    # значение берется по первому столбцу (данные для всей страницы одним запросом).
+    def __init__(self, *columns, keys=None, convert=None, load=None):
+        self.columns = columns
+        self.keys = keys
+        self.convert = convert
+        self.load = load
+
+
+def media_url(storage, request):
+    # То же, что request.build_absolute_uri(storage.url(name)), но без urljoin и
+    # разбора URL на каждую строку: для FileSystemStorage с base_url вида /media/
+    # абсолютный префикс вычисляется один раз. Имена, которые urljoin или
+    # build_absolute_uri обработали бы иначе (схема, пустые сегменты, . и ..), и другие
+    # хранилища идут обычным путем.
+    def default(name):
+        return request.build_absolute_uri(storage.url(name))
+
+    base_url = getattr(storage, 'base_url', None)
+    if not (isinstance(storage, FileSystemStorage) and base_url
+            and base_url.startswith('/') and not base_url.startswith('//') and base_url.endswith('/')):
+        return default
+    prefix = request.build_absolute_uri(base_url)
+
+    def convert(name):
+        path = filepath_to_uri(name).lstrip('/')
+        if ':' in path or './' in path or '//' in path or path.endswith('.'):
+            return default(name)
+        return prefix + path
+    return convert
+
+
+def file_url(storage, request):
+    # Как ImageField/FileField DRF: None для пустого файла, иначе абсолютный URL
+    url = media_url(storage, request)
+
+    def convert(name):
+        return url(name) if name else None
+    return convert
+
+
+def datetime_representation(field):
+    # DateTimeField.to_representation, но часовой пояс определяется один раз,
+    # а не при каждом вызове (get_current_timezone заметен на больших выгрузках)
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if not value or isinstance(value, str) or value.utcoffset() is None:
+            return field.to_representation(value)
+        try:
+            value = value.astimezone(field_timezone).isoformat()
+        except OverflowError:
+            return field.to_representation(value)
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def url_pattern(viewname):
+    # reverse() один раз на запрос, дальше только подстановка pk
+    head, _, tail = reverse(viewname, args=[0]).rpartition('/0/')
+
+    def convert(pk):
+        return f'{head}/{pk}/{tail}'
+    return convert
+
+
+def compile_transform(plan):
+    # Функция строка -> словарь генерируется один раз для набора полей:
+    # литерал словаря с обращениями row[i] без циклов по полям
+    items = []
+    for position, (name, kind, indexes) in enumerate(plan):
+        if kind == 'column':
+            value = f'row[{indexes[0]}]'
+        elif kind == 'keys':
+            value = '{' + ', '.join(f'{key!r}: row[{index}]' for key, index in indexes) + '}'
+        else:
+            value = f'c{position}(' + ', '.join(f'row[{index}]' for index in indexes) + ')'
+        items.append(f'{name!r}: {value}')
+
+    source = (
+        f'def factory({", ".join(f"c{position}" for position in range(len(plan)))}):\n'
+        f'    def transform(row):\n'
+        f'        return {{{", ".join(items)}}}\n'
+        f'    return transform\n'
+    )
+    factory = _factories.get(source)
+    if factory is None:
+        namespace = {}
+        exec(compile(source, '<fastlist>', 'exec'), namespace)
+        factory = _factories[source] = namespace['factory']
+    return factory
+
+
+# Быстрый режим list без сериализатора: строки выбираются через values_list
+# только нужных столбцов и превращаются в словари сгенерированной функцией.
+# Вывод совпадает с выводом сериализатора list (включая ?fields= и ?omit=).
+# Вьюсет включает режим атрибутом fast_list и описывает в fast_list_fields
+# (или get_fast_list_fields) поля, которых нет среди простых полей модели.
+# Если в сериализаторе есть поле, которое не удается получить из столбцов,
+# а также в режиме курсора используется обычный путь. JSON списка рендерит
+# FastJSONRenderer (вывод тот же, что у JSONRenderer).
+class FastListMixin:
+    fast_list = False
+    fast_list_fields = {}
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if not self.fast_list or self.action != 'list':
+            return renderers
+        return [FastJSONRenderer() if type(renderer) is JSONRenderer else renderer for renderer in renderers]
+
+    def get_fast_list_fields(self):
+        return self.fast_list_fields
+
+    def use_fast_list(self):
+        if not self.fast_list or self.action != 'list':
+            return False
+        paginator = self.paginator
+        # KeysetPagination строит курсор по атрибутам объектов модели
+        return not (isinstance(paginator, CursorOrPageNumberPagination)
+                    and self.request.query_params.get(paginator.mode_query_param) == paginator.cursor_mode)
+
+    def get_fast_list_plan(self):
+        specs = self.get_fast_list_fields()
+        columns = {}
+        plan, field_specs = [], []
+        for name, field in self.get_serializer().fields.items():
+            if field.write_only:
+                continue
+            spec = specs.get(name)
+            if spec is None:
+                if '.' in field.source or field.source == '*':
+                    return None
+                if isinstance(field, PLAIN_FIELDS):
+                    spec = FastField(field.source)
+                elif isinstance(field, fields.DateTimeField):
+                    spec = FastField(field.source, convert=datetime_representation(field))
+                elif isinstance(field, CONVERTED_FIELDS):
+                    spec = FastField(field.source, convert=field.to_representation)
+                else:
+                    return None
+
+            indexes = [columns.setdefault(column, len(columns)) for column in spec.columns]
+            if spec.keys is not None:
+                plan.append((name, 'keys', list(zip(spec.keys, indexes))))
+            elif spec.convert is None and spec.load is None:
+                plan.append((name, 'column', indexes))
+            else:
+                plan.append((name, 'call', indexes[:1] if spec.load else indexes))
+            field_specs.append(spec)
+        return list(columns), compile_transform(plan), field_specs
+
+    def list(self, request, *args, **kwargs):
+        fast_plan = self.get_fast_list_plan() if self.use_fast_list() else None
+        if fast_plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.get_fast_list_queryset(self.filter_queryset(self.get_queryset()), fast_plan)
+        page = self.paginate_queryset(queryset)
+        data = self.get_fast_list_data(list(queryset) if page is None else list(page), fast_plan)
+
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @staticmethod
+    def get_fast_list_queryset(queryset, fast_plan):
+        return queryset.prefetch_related(None).values_list(*fast_plan[0])
+
+    @staticmethod
+    def get_fast_list_data(rows, fast_plan):
+        columns, factory, specs = fast_plan
+        converters = []
+        for spec in specs:
+            if spec.load is not None:
+                index = columns.index(spec.columns[0])
+                converters.append(spec.load([row[index] for row in rows]).get)
+            else:
+                converters.append(spec.convert)
+        transform = factory(*converters)
+        return [transform(row) for row in rows]
@@ -0,0 +1,156 @@
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from utils.cache import bump_version
+
+
+logger = logging.getLogger(__name__)
+
+# Формат варианта: (формат Pillow, расширение, параметры сохранения)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def get_executor():
+    # Пул процессов создается при первой загрузке изображения. spawn вместо fork:
+    # дочерние процессы не наследуют соединения с БД и потоки сервера
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+def render_variants(data, widths):
+    # Выполняется в дочернем процессе: только работа Pillow над байтами, без Django.
+    # Изображение не увеличивается: ширины больше исходной заменяются исходной
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    if image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        image = image.convert('RGBA')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+
+    rendered = {fmt: {} for fmt in VARIANT_FORMATS}
+    for width in sorted({min(width, image.width) for width in widths}, reverse=True):
+        height = max(1, round(image.height * width / image.width))
+        # Каждый следующий размер уменьшается из предыдущего, а не из оригинала
+        image = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+        for fmt, (pillow_format, _, options) in VARIANT_FORMATS.items():
+            buffer = io.BytesIO()
+            image.save(buffer, pillow_format, **options)
+            rendered[fmt][width] = buffer.getvalue()
+    return rendered
+
+
+def variant_name(name, width, fmt):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{width}w.{VARIANT_FORMATS[fmt][1]}'
+
+
+def store_variants(field_file, rendered):
+    # Варианты сохраняются рядом с оригиналом: images/posters/x.webp -> images/posters/x.240w.jpg
+    storage = field_file.storage
+    variants = {'source': field_file.name}
+    for fmt, sizes in rendered.items():
+        variants[fmt] = {}
+        for width, data in sorted(sizes.items()):
+            name = variant_name(field_file.name, width, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            variants[fmt][str(width)] = storage.save(name, ContentFile(data))
+    return variants
+
+
+def variant_names(variants):
+    return {name for fmt in VARIANT_FORMATS for name in (variants or {}).get(fmt, {}).values()}
+
+
+def delete_variants(storage, names):
+    for name in names:
+        storage.delete(name)
+
+
+def save_variants(model, pk, field_name, variants_field, rendered):
+    # Сохраняет варианты, если файл за время обработки не заменили
+    instance = model.objects.filter(pk=pk).first()
+    field_file = getattr(instance, field_name, None)
+    if not field_file or field_file.name != rendered['source']:
+        return
+    old_names = variant_names(getattr(instance, variants_field))
+    variants = store_variants(field_file, rendered['variants'])
+    model.objects.filter(pk=pk).update(**{variants_field: variants})
+    delete_variants(field_file.storage, old_names - variant_names(variants))
+    bump_version(model._meta.model_name)
+
+
+def finish_variants(model, pk, field_name, variants_field, source, future):
+    # Вызывается в служебном потоке пула после обработки изображения
+    try:
+        rendered = {'source': source, 'variants': future.result()}
+        save_variants(model, pk, field_name, variants_field, rendered)
+    except Exception:
+        logger.exception('Не удалось создать варианты %s для %s %s', field_name, model.__name__, pk)
+    finally:
+        connection.close()
+
+
+def schedule_variants(model, pk, field_name, variants_field, field_file):
+    with field_file.open('rb') as file:
+        data = file.read()
+    future = get_executor().submit(render_variants, data, settings.IMAGE_VARIANT_WIDTHS)
+    future.add_done_callback(partial(finish_variants, model, pk, field_name, variants_field, field_file.name))
+
+
+def sync_variants(instance, field_name, variants_field):
+    # Вызывается после сохранения: новый файл отправляется в пул процессов
+    # после фиксации транзакции, при удалении файла удаляются и варианты
+    field_file = getattr(instance, field_name)
+    variants = getattr(instance, variants_field) or {}
+    model = type(instance)
+    if field_file and variants.get('source') != field_file.name:
+        transaction.on_commit(partial(
+            schedule_variants, model, instance.pk, field_name, variants_field, field_file
+        ))
+    elif not field_file and variants:
+        model.objects.filter(pk=instance.pk).update(**{variants_field: {}})
+        transaction.on_commit(partial(delete_variants, field_file.storage, variant_names(variants)))
+
+
+def build_srcset(storage, variants, request=None, url=None):
+    # {'webp': 'url 80w, url 240w, ...', 'jpeg': ...} для <picture>/<img srcset>.
+    # url(name) - готовая функция построения URL (utils.fastlist.media_url)
+    if not variants:
+        return None
+    if url is None:
+        def url(name):
+            return request.build_absolute_uri(storage.url(name)) if request else storage.url(name)
+    srcset = {}
+    for fmt in VARIANT_FORMATS:
+        items = []
+        for width, name in sorted(variants.get(fmt, {}).items(), key=lambda item: int(item[0])):
+            items.append(f'{url(name)} {width}w')
+        srcset[fmt] = ', '.join(items)
+    return srcset
+
+
+def smallest_variant_url(field_file, variants, fmt='webp'):
+    sizes = (variants or {}).get(fmt)
+    if not sizes:
+        return field_file.url
+    return field_file.storage.url(sizes[min(sizes, key=int)])
@@ -0,0 +1,55 @@
+import logging
+import threading
+
+from django.db import connection
+
+from utils.cache import get_versions
+
+
+logger = logging.getLogger(__name__)
+
+
+# Данные, которые строятся один раз на процесс и пересобираются, только когда
+# меняется версия одной из моделей dependencies (см. utils.cache). Проверка
+# актуальности - одно обращение к кешу, без запросов к БД.
+# С background=True пересборка идет в отдельном потоке, а запросы до ее
+# окончания получают предыдущие данные; синхронно строится только первая версия.
+class VersionedLookup:
+
+    def __init__(self, dependencies, build, background=False):
+        self.dependencies = list(dependencies)
+        self.build = build
+        self.background = background
+        self.versions = None
+        self.data = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def get(self):
+        versions = get_versions(*self.dependencies)
+        if versions == self.versions:
+            return self.data
+        with self.lock:
+            if versions != self.versions:
+                if self.background and self.data is not None:
+                    if self.thread is None:
+                        self.thread = threading.Thread(target=self.rebuild, args=(versions,), daemon=True)
+                        self.thread.start()
+                else:
+                    self.data = self.build()
+                    self.versions = versions
+            return self.data
+
+    def rebuild(self, versions):
+        # Версии берутся до сборки: изменения во время нее вызовут следующую пересборку
+        try:
+            data = self.build()
+            with self.lock:
+                self.data = data
+                self.versions = versions
+        except Exception:
+            logger.exception('Не удалось пересобрать %s', self.build.__name__)
+        finally:
+            with self.lock:
+                self.thread = None
+            connection.close()
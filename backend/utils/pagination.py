@@ -0,0 +1,237 @@
+import base64
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from utils.cache import get_versions, make_key, normalize_query
+
+
+class CachedCountPaginator(DjangoPaginator):
+
+    def __init__(self, object_list, per_page, cache_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        cached = cache.get(self.cache_key) if self.cache_key else None
+        if cached is not None:
+            count, self.count_exact = cached
+            return count
+
+        count, self.count_exact = self.compute_count()
+        if self.cache_key:
+            cache.set(self.cache_key, (count, self.count_exact), settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def compute_count(self):
+        queryset = self.object_list.order_by()
+        threshold = settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD
+        # Оценка планировщика есть только у PostgreSQL; для остальных СУБД
+        # считаем точно одним COUNT(*), но результат все равно кешируется
+        if threshold is None or connections[queryset.db].vendor != 'postgresql':
+            return queryset.count(), True
+
+        # COUNT по подзапросу с LIMIT: дешевый, пока строк меньше порога
+        limited = queryset[:threshold + 1].count()
+        if limited <= threshold:
+            return limited, True
+        return max(self.estimate_count(queryset), limited), False
+
+    @staticmethod
+    def estimate_count(queryset):
+        plan = queryset.explain(format='json')
+        return int(json.loads(plan)[0]['Plan']['Plan Rows'])
+
+
+# Постраничная навигация, в которой COUNT(*) кешируется для каждой комбинации
+# фильтров. Ключ включает версии моделей, от которых зависит список
+# (response_cache_dependencies вьюсета, см. utils.views), поэтому любая запись
+# в них сбрасывает счетчики.
+# Выше PAGINATION_COUNT_ESTIMATE_THRESHOLD строк используется оценка
+# количества, а в ответе count_exact=false.
+class CachedCountPagination(PageNumberPagination):
+    count_cache_ignored_params = ('page', 'page_size', 'pagination', 'cursor', 'fields', 'omit')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_cache_key = self.get_count_cache_key(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def django_paginator_class(self, queryset, page_size):
+        return CachedCountPaginator(queryset, page_size, cache_key=self.count_cache_key)
+
+    def get_count_cache_key(self, queryset, request, view):
+        if hasattr(view, 'get_response_cache_dependencies'):
+            dependencies = view.get_response_cache_dependencies()
+        else:
+            dependencies = [queryset.model._meta.model_name]
+        versions = get_versions(*dependencies)
+        return make_key(
+            'pagination_count',
+            queryset.model._meta.label,
+            sorted(versions.items()),
+            normalize_query(request.query_params, exclude=self.count_cache_ignored_params),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'count_exact': self.page.paginator.count_exact,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+# Постраничный вывод по курсору без OFFSET и COUNT(*).
+# Курсор хранит значения полей сортировки последней строки страницы,
+# следующая страница выбирается условием "строго после" этих значений.
+# Сортировка берется из queryset (то есть из параметра sort FilterSet),
+# к ней всегда добавляется id, чтобы позиция была однозначной.
+# NULL всегда идут в конце, в обоих направлениях сортировки.
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*[
+            F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_last=True)
+            for name, descending, _ in self.ordering
+        ])
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_ordering(self, queryset):
+        # Сортировка по релевантности поиска (extra_order_by) не выражается через Q,
+        # в этом случае используется сортировка модели
+        ordering = list(queryset.query.order_by)
+        if not ordering or queryset.query.extra_order_by:
+            ordering = list(queryset.model._meta.ordering)
+
+        result = []
+        for item in ordering:
+            if not isinstance(item, str) or item == '?':
+                continue
+            descending = item.startswith('-')
+            name = item.lstrip('-')
+            if name == 'pk':
+                name = 'id'
+            result.append((name, descending, self.is_nullable(queryset.model, name)))
+        if 'id' not in [name for name, _, _ in result]:
+            result.append(('id', False, False))
+        return result
+
+    @staticmethod
+    def is_nullable(model, name):
+        # Аннотации и поля связанных моделей считаем допускающими NULL
+        if LOOKUP_SEP in name:
+            return True
+        try:
+            return model._meta.get_field(name).null
+        except FieldDoesNotExist:
+            return True
+
+    def get_position_filter(self, position):
+        condition = None
+        for (name, descending, nullable), value in reversed(list(zip(self.ordering, position))):
+            if value is None:
+                # После NULL идут только такие же NULL
+                strict = None
+                equal = Q(**{f'{name}__isnull': True})
+            else:
+                strict = Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+                if nullable:
+                    strict |= Q(**{f'{name}__isnull': True})
+                equal = Q(**{name: value})
+
+            if condition is None:
+                condition = strict if strict is not None else Q(pk__in=[])
+            elif strict is None:
+                condition = equal & condition
+            else:
+                condition = strict | (equal & condition)
+        return condition
+
+    def get_position(self, instance):
+        position = []
+        for name, _, _ in self.ordering:
+            value = instance
+            for attr in name.split(LOOKUP_SEP):
+                value = getattr(value, attr, None) if value is not None else None
+            if isinstance(value, (date, datetime)):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        payload = {
+            'o': [('-' if descending else '') + name for name, descending, _ in self.ordering],
+            'p': self.get_position(self.page[-1]),
+        }
+        cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            ordering = [('-' if descending else '') + name for name, descending, _ in self.ordering]
+            if payload['o'] != ordering or len(payload['p']) != len(ordering):
+                raise ValueError
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return payload['p']
+
+
+# Обычная постраничная навигация, а с параметром ?pagination=cursor -
+# навигация по курсору (KeysetPagination) для бесконечной прокрутки
+class CursorOrPageNumberPagination(CachedCountPagination):
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if request.query_params.get(self.mode_query_param) == self.cursor_mode:
+            self.cursor_paginator = KeysetPagination()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,49 +1,156 @@
-from django.db.models import Count, Q, Avg, Case, When, ExpressionWrapper, F, IntegerField, Value
-from django.db.models.functions import ExtractMonth, ExtractDay
+from django.db.models import Count, Case, When, F, IntegerField, Value, Prefetch, Window
+from django.db.models.functions import Coalesce, DenseRank, ExtractYear, RowNumber
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
 
-def annotate_user_queryset(queryset):
-    return queryset.annotate(
-        _watches=Count('ratings', filter=Q(ratings__is_watched=True)),
-        _rates=Count('ratings', filter=Q(ratings__rate__isnull=False)),
-        _reviews=Count('reviews'),
-    ).order_by('username')
+# Счетчики хранятся в UserStats и обновляются сигналами (см. utils.user_stats):
+# один join по первичному ключу без группировки. Join левый: пользователь,
+# созданный без сигнала (bulk_create, loaddata), выводится с нулями, пока
+# rebuild_user_stats не создаст его строку
+USER_COUNTS = {
+    'watches': Coalesce(F('stats__watches'), Value(0)),
+    'rates': Coalesce(F('stats__rates'), Value(0)),
+    'reviews': Coalesce(F('stats__reviews'), Value(0)),
+}
+
+
+def annotate_user_queryset(queryset, fields=tuple(USER_COUNTS)):
+    # fields - какие счетчики нужны; без них join не делается
+    return queryset.annotate(**{
+        f'_{name}': USER_COUNTS[name] for name in fields
+    }).order_by('username')
 
 
 def annotate_movie_queryset(queryset):
+    # Средняя оценка хранится в индексированном столбце, join с оценками не нужен
     return queryset.annotate(
-        _rate=Avg('ratings__rate', filter=Q(ratings__rate__isnull=False)),
+        _rate=F('rating_avg'),
     ).order_by('-_rate')
 
+def prefetch_user_ratings(queryset, user, rating_queryset):
+    # Оценки пользователя для всех фильмов страницы одним запросом
+    if not user.is_authenticated:
+        return queryset
+    return queryset.prefetch_related(Prefetch(
+        'ratings',
+        queryset=rating_queryset.filter(user=user).only('id', 'movie_id', 'rate', 'is_watched'),
+        to_attr='_user_ratings',
+    ))
+
+
+def get_user_actions(user, movie_ids, rating_queryset):
+    # То же, что user_actions из prefetch_user_ratings, но словарями по id фильма
+    # (быстрый список фильмов); при нескольких оценках берется первая по сортировке
+    actions = {}
+    ratings = rating_queryset.filter(user=user, movie_id__in=movie_ids).values_list('movie_id', 'id', 'rate', 'is_watched')
+    for movie_id, pk, rate, is_watched in ratings:
+        actions.setdefault(movie_id, {'id': pk, 'rate': rate, 'is_watched': is_watched})
+    return actions
+
+
+def prefetch_top_movies(queryset, profession_queryset, size=5):
+    # Лучшие по средней оценке фильмы всех личностей страницы одним запросом.
+    # DENSE_RANK в окне по личности: у фильма, где личность и актер, и режиссер,
+    # обе строки получают один ранг и не вытесняют другие фильмы
+    ranked = profession_queryset.annotate(
+        _rank=Window(
+            DenseRank(),
+            partition_by=F('person_id'),
+            order_by=[F('movie__rating_avg').desc(nulls_last=True), F('movie_id').asc()],
+        ),
+        _title=F('movie__title'),
+    ).filter(_rank__lte=size).order_by('_rank').only('id', 'person_id', 'movie_id')
+    return queryset.prefetch_related(Prefetch('professions', queryset=ranked, to_attr='_top_professions'))
+
+
+def count_movie_facets(get_queryset):
+    # get_queryset(facet) возвращает фильмы по текущим фильтрам без фильтра
+    # самого фасета, чтобы показывать количество для соседних значений
+    def grouped(facet, field, **filters):
+        rows = (get_queryset(facet).order_by()
+                .filter(**filters).values(field).annotate(count=Count('id', distinct=True))
+                .order_by('-count', field))
+        return [{'value': row[field], 'count': row['count']} for row in rows]
+
+    years = (get_queryset('year').order_by()
+             .filter(release_date__isnull=False)
+             .annotate(year=ExtractYear('release_date')).values('year')
+             .annotate(count=Count('id')).order_by('-year'))
+    return {
+        'genres': grouped('genre', 'genres__name', genres__isnull=False),
+        'countries': grouped('country', 'countries__name', countries__isnull=False),
+        'years': [{'value': row['year'], 'count': row['count']} for row in years],
+        'types': grouped('type', 'type'),
+    }
+
+
 def annotate_genre_queryset(queryset):
     return queryset.annotate(
         _movies_count=Count('movies'),
     ).order_by('name')
 
-def annotate_person_queryset(queryset):
-    tz = ZoneInfo("Europe/Moscow")  # например Москва
-    today = datetime.now(tz).date()
-    return queryset.exclude(birth_date__isnull=True).annotate(
-        month=ExtractMonth("birth_date"),
-        day=ExtractDay("birth_date"),
-        ).annotate(
-            has_had_birthday=Case(
-                When(Q(month__lt=today.month)| Q(month=today.month, day__lt=today.day),
-                     then=Value(1)),
-                default=Value(0),
-                output_field=IntegerField(),),
-        ).annotate(
-            month_offset=Case(
-                When(has_had_birthday=1,
-                     then=F("month") + Value(12)),
-                default=F("month"),
-                output_field=IntegerField(),
-            )
-        ).annotate(
-            _days_to_birthday=ExpressionWrapper(
-                ((F("month_offset") * 31 + F("day")) - (today.month * 31 + today.day)),
-                output_field=IntegerField(),
-            )
-    ).order_by("month_offset", "day")
+
+def annotate_country_queryset(queryset):
+    return queryset.annotate(
+        _movies_count=Count('movies'),
+    ).order_by('name')
+
+
+def get_poster_pools(through_model, field, size):
+    # До size постеров лучших по оценке фильмов для каждого жанра/страны одним запросом
+    rows = (through_model.objects
+            .exclude(movie__poster='').exclude(movie__poster__isnull=True)
+            .annotate(position=Window(
+                RowNumber(),
+                partition_by=F(field),
+                order_by=[F('movie__rating_avg').desc(nulls_last=True), F('movie_id').asc()],
+            ))
+            .filter(position__lte=size)
+            .values_list(field, 'movie__poster'))
+    pools = {}
+    for key, poster in rows:
+        pools.setdefault(key, []).append(poster)
+    return pools
+
+# Дни рождения считаются по московскому времени
+BIRTHDAY_TIMEZONE = ZoneInfo('Europe/Moscow')
+
+
+def birthday_key(value):
+    # Месяц * 100 + день: порядок ключей совпадает с порядком дней в году
+    return value.month * 100 + value.day if value else None
+
+
+def today_birthday_key():
+    return birthday_key(datetime.now(BIRTHDAY_TIMEZONE).date())
+
+
+def birthday_day_version():
+    # Начало текущих суток по московскому времени в наносекундах, как версии
+    # utils.cache: меняется вместе с today_birthday_key
+    today = datetime.now(BIRTHDAY_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(today.timestamp()) * 10 ** 9
+
+
+def birthday_ordering(descending=False):
+    # Сначала дни рождения с сегодняшнего дня до конца года, затем с начала года;
+    # выражение над целым столбцом без извлечения месяца и дня из даты
+    key = today_birthday_key()
+    order = Case(
+        When(birthday_key__lt=key, then=F('birthday_key') + Value(10000)),
+        default=F('birthday_key'),
+        output_field=IntegerField(),
+    )
+    return order.desc(nulls_last=True) if descending else order.asc(nulls_last=True)
+
+
+def get_upcoming_birthdays(queryset, limit):
+    # Два запроса по индексу (birthday_key, id): от сегодняшнего дня до конца
+    # года и, если не хватило, с начала года
+    key = today_birthday_key()
+    queryset = queryset.filter(birthday_key__isnull=False).order_by('birthday_key', 'id')
+    persons = list(queryset.filter(birthday_key__gte=key)[:limit])
+    if len(persons) < limit:
+        persons += queryset.filter(birthday_key__lt=key)[:limit - len(persons)]
+    return persons
@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+
+def apply_rating_delta(movie_model, movie_id, delta_sum, delta_count):
+    new_sum = F('rating_sum') + delta_sum
+    new_count = F('rating_count') + delta_count
+    # Один UPDATE: правая часть видит старые значения столбцов, поэтому среднее
+    # считается из тех же выражений, что и новые сумма и количество
+    movie_model.objects.filter(pk=movie_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        rating_avg=Case(
+            When(rating_count=-delta_count, then=Value(None)),
+            default=new_sum / new_count,
+            output_field=FloatField(),
+        ),
+    )
+
+
+def rating_changed(movie_model, rating, old_movie_id=None, old_rate=None):
+    with transaction.atomic():
+        if old_movie_id is not None:
+            apply_rating_delta(movie_model, old_movie_id, -old_rate, -1)
+        if rating is not None:
+            apply_rating_delta(movie_model, rating.movie_id, rating.rate, 1)
+
+
+def rebuild_movie_ratings(movie_queryset, rating_model):
+    ratings = rating_model.objects.filter(movie=OuterRef('pk')).order_by().values('movie')
+    rating_sum = ratings.annotate(total=Sum('rate')).values('total')
+    rating_count = ratings.annotate(total=Count('pk')).values('total')
+    return movie_queryset.update(
+        rating_sum=Coalesce(Subquery(rating_sum), Value(0.0)),
+        rating_count=Coalesce(Subquery(rating_count), Value(0)),
+        rating_avg=Subquery(rating_sum) / Subquery(rating_count, output_field=FloatField()),
+    )
@@ -0,0 +1,144 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+from scipy import sparse
+
+
+def interaction_weights(rates, watched, alpha=10.0, like_threshold=6):
+    # Неявная обратная связь (Hu, Koren, Volinsky): предпочтение 1 для оценок
+    # от like_threshold и 0 для низких. Уверенность растет с удалением оценки
+    # от середины шкалы и с отметкой о просмотре, поэтому низкая оценка -
+    # уверенный отрицательный пример, а не отсутствие данных.
+    rates = np.asarray(rates, dtype=np.float64)
+    preference = (rates >= like_threshold).astype(np.float64)
+    confidence = 1 + alpha * (np.abs(rates - 5.5) / 4.5 + np.asarray(watched, dtype=np.float64))
+    return preference, confidence
+
+
+def interaction_matrices(rows, columns, shape, preference, confidence):
+    # Разреженные матрицы (C - 1) и C * P: первая нужна в левой части
+    # нормальных уравнений, вторая дает правую часть
+    weights = sparse.csr_matrix((confidence - 1, (rows, columns)), shape=shape)
+    targets = sparse.csr_matrix((confidence * preference, (rows, columns)), shape=shape)
+    return weights, targets
+
+
+def split_rows(indptr, max_nnz):
+    # Блоки строк с ограниченным числом ненулевых элементов: память на
+    # промежуточную матрицу nnz x f не зависит от размера данных
+    bounds = []
+    start, n_rows = 0, len(indptr) - 1
+    while start < n_rows:
+        stop = int(np.searchsorted(indptr, indptr[start] + max_nnz, side='right')) - 1
+        stop = min(max(stop, start + 1), n_rows)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+
+def solve_block(bounds, weights, targets, fixed, current, gram, steps):
+    # Для каждой строки u система (FtF + lI + Ft (Cu - I) F) x = Ft Cu p(u)
+    # решается несколькими шагами сопряженных градиентов сразу для всех строк
+    # блока. Произведение Ft (Cu - I) F x считается через разреженную матрицу
+    # без построения матриц f x f для каждой строки.
+    start, stop = bounds
+    weights, targets = weights[start:stop], targets[start:stop]
+    rows = np.repeat(np.arange(stop - start), np.diff(weights.indptr))
+    vectors = fixed[weights.indices]
+
+    def product(x):
+        dots = np.einsum('ij,ij->i', vectors, x[rows])
+        weighted = sparse.csr_matrix((weights.data * dots, weights.indices, weights.indptr), shape=weights.shape)
+        return x @ gram + weighted @ fixed
+
+    x = current[start:stop].copy()
+    residual = targets @ fixed - product(x)
+    direction = residual.copy()
+    norm = np.einsum('ij,ij->i', residual, residual)
+    for _ in range(steps):
+        applied = product(direction)
+        curvature = np.einsum('ij,ij->i', direction, applied)
+        step = np.divide(norm, curvature, out=np.zeros_like(norm), where=curvature > 0)
+        x += step[:, None] * direction
+        residual -= step[:, None] * applied
+        new_norm = np.einsum('ij,ij->i', residual, residual)
+        ratio = np.divide(new_norm, norm, out=np.zeros_like(norm), where=norm > 0)
+        direction = residual + ratio[:, None] * direction
+        norm = new_norm
+    return x
+
+
+def solve_factors(weights, targets, fixed, current, regularization, steps=3, workers=None, max_nnz=200_000):
+    # Один шаг ALS: факторы всех строк при фиксированных факторах столбцов.
+    # Блоки строк считаются параллельно в потоках: SciPy и NumPy отпускают GIL.
+    gram = fixed.T @ fixed + regularization * np.eye(fixed.shape[1])
+    solve = partial(
+        solve_block, weights=weights, targets=targets, fixed=fixed, current=current, gram=gram, steps=steps,
+    )
+    blocks = split_rows(weights.indptr, max_nnz)
+    if not blocks:
+        return current
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        return np.concatenate(list(executor.map(solve, blocks)))
+
+
+def train_als(user_index, movie_index, preference, confidence, shape, factors=32, regularization=0.1,
+              iterations=10, workers=None, seed=0):
+    # Implicit ALS с приближенным решением через сопряженные градиенты (Takacs и др.)
+    n_users, n_movies = shape
+    weights, targets = interaction_matrices(user_index, movie_index, shape, preference, confidence)
+    weights_t, targets_t = weights.T.tocsr(), targets.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(0, 0.01, (n_users, factors))
+    movie_factors = rng.normal(0, 0.01, (n_movies, factors))
+    for _ in range(iterations):
+        user_factors = solve_factors(weights, targets, movie_factors, user_factors, regularization, workers=workers)
+        movie_factors = solve_factors(weights_t, targets_t, user_factors, movie_factors, regularization,
+                                      workers=workers)
+    return user_factors, movie_factors
+
+
+def fold_in_users(user_index, movie_index, preference, confidence, n_users, movie_factors,
+                  regularization=0.1, workers=None):
+    # Дообучение: факторы пользователей по их оценкам при неизменных факторах фильмов.
+    # Начальное приближение нулевое, поэтому шагов больше, чем в полном обучении.
+    shape = (n_users, len(movie_factors))
+    weights, targets = interaction_matrices(user_index, movie_index, shape, preference, confidence)
+    current = np.zeros((n_users, movie_factors.shape[1]))
+    return solve_factors(weights, targets, movie_factors, current, regularization,
+                         steps=movie_factors.shape[1], workers=workers)
+
+
+def seen_matrix(user_index, movie_index, shape):
+    seen = sparse.csr_matrix((np.ones(len(user_index), dtype=np.int8), (user_index, movie_index)), shape=shape)
+    seen.sort_indices()
+    return seen
+
+
+def top_n(user_factors, movie_factors, seen, n=50, max_cells=20_000_000):
+    # Кандидаты для каждого пользователя без уже оцененных фильмов.
+    # Оценки считаются блоками пользователей, чтобы матрица блока
+    # не превышала max_cells элементов.
+    n_users, n_movies = len(user_factors), len(movie_factors)
+    n = min(n, n_movies)
+    chunk = max(1, max_cells // max(n_movies, 1))
+    movie_factors = movie_factors.astype(np.float32)
+    for start in range(0, n_users, chunk):
+        stop = min(start + chunk, n_users)
+        scores = user_factors[start:stop].astype(np.float32) @ movie_factors.T
+        block = seen[start:stop]
+        rows = np.repeat(np.arange(stop - start), np.diff(block.indptr))
+        scores[rows, block.indices] = -np.inf
+        if n == 0:
+            continue
+        best = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        for row in range(stop - start):
+            keep = np.isfinite(best_scores[row])
+            yield start + row, best[row][keep], best_scores[row][keep]
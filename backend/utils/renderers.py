@@ -0,0 +1,61 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+def has_special_floats(value):
+    # Числа, которые orjson записывает иначе, чем json (0.00001 вместо 1e-05,
+    # 1e16 вместо 1e+16), и NaN/Infinity, на которых строгий JSONRenderer DRF
+    # выдает ошибку. Числа от 1e-4 до 1e16 по модулю оба пишут одинаково
+    if isinstance(value, dict):
+        items = value.values()
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        return isinstance(value, float) and bool(value) and not 1e-4 <= abs(value) < 1e16
+    for item in items:
+        kind = type(item)
+        if kind is str or kind is int or item is None:
+            continue
+        if kind is float:
+            if item and not 1e-4 <= abs(item) < 1e16:
+                return True
+        elif has_special_floats(item):
+            return True
+    return False
+
+
+# JSONRenderer на orjson. Вывод побайтно совпадает со стандартным рендерером DRF:
+# компактные разделители, UTF-8 без экранирования, даты и прочие типы через
+# JSONEncoder DRF, экранированные \u2028 и \u2029. Данные с числами, которые orjson
+# записал бы иначе (см. has_special_floats), а также вывод без orjson, с отступами
+# (Browsable API, ?indent) и при нестандартных UNICODE_JSON / COMPACT_JSON
+# рендерит обычный JSONRenderer.
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (data is None or orjson is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+                or has_special_floats(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except (orjson.JSONEncodeError, TypeError):
+            # Например, целые больше 64 бит
+            return super().render(data, accepted_media_type, renderer_context)
+
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in ret:
+                ret = ret.replace(separator, escaped)
+        return ret
@@ -0,0 +1,137 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+# Внешний контент: FTS5 хранит только индекс, строки берутся из content
+def fts_create(table, content, columns):
+    return (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+        f"{', '.join(columns)}, content='{content}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+
+
+# Триггеры пересоздаются после каждой миграции: sqlite при изменении
+# схемы таблицы content пересоздает ее и удаляет ее триггеры
+def fts_triggers(table, content, columns):
+    names = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {content} BEGIN
+        INSERT INTO {table}(rowid, {names}) VALUES (new.id, {new_values});
+    END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {content} BEGIN
+        INSERT INTO {table}({table}, rowid, {names})
+        VALUES ('delete', old.id, {old_values});
+    END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {names} ON {content} BEGIN
+        INSERT INTO {table}({table}, rowid, {names})
+        VALUES ('delete', old.id, {old_values});
+        INSERT INTO {table}(rowid, {names}) VALUES (new.id, {new_values});
+    END""",
+    ]
+
+
+def fts_drop(table):
+    return [
+        f'DROP TRIGGER IF EXISTS {table}_ai',
+        f'DROP TRIGGER IF EXISTS {table}_ad',
+        f'DROP TRIGGER IF EXISTS {table}_au',
+        f'DROP TABLE IF EXISTS {table}',
+    ]
+
+
+MOVIE_FTS_TABLE = 'catalog_movie_fts'
+MOVIE_FTS_COLUMNS = ('title', 'description')
+MOVIE_FTS_CREATE = fts_create(MOVIE_FTS_TABLE, 'catalog_movie', MOVIE_FTS_COLUMNS)
+MOVIE_FTS_TRIGGERS = fts_triggers(MOVIE_FTS_TABLE, 'catalog_movie', MOVIE_FTS_COLUMNS)
+MOVIE_FTS_REBUILD = f"INSERT INTO {MOVIE_FTS_TABLE}({MOVIE_FTS_TABLE}) VALUES ('rebuild')"
+
+# Вес заголовка выше веса описания; rank хранится в конфигурации индекса,
+# поэтому столбец rank можно использовать и в запросах с GROUP BY
+MOVIE_FTS_RANK = f"INSERT INTO {MOVIE_FTS_TABLE}({MOVIE_FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 1.0)')"
+
+MOVIE_FTS_DROP = fts_drop(MOVIE_FTS_TABLE)
+
+# Текст биографий (Person.biography_text, см. utils.biographies)
+PERSON_FTS_TABLE = 'catalog_person_fts'
+PERSON_FTS_COLUMNS = ('biography_text',)
+PERSON_FTS_CREATE = fts_create(PERSON_FTS_TABLE, 'catalog_person', PERSON_FTS_COLUMNS)
+PERSON_FTS_TRIGGERS = fts_triggers(PERSON_FTS_TABLE, 'catalog_person', PERSON_FTS_COLUMNS)
+PERSON_FTS_REBUILD = f"INSERT INTO {PERSON_FTS_TABLE}({PERSON_FTS_TABLE}) VALUES ('rebuild')"
+PERSON_FTS_DROP = fts_drop(PERSON_FTS_TABLE)
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+# Каждое слово запроса ищется как префикс: 'бессл ублю' -> '"бессл"* "ублю"*'
+def build_match_query(value):
+    tokens = TOKEN_RE.findall(value.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def ensure_fts_triggers(table, triggers):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [table]
+        )
+        if cursor.fetchone() is None:
+            return
+        for sql in triggers:
+            cursor.execute(sql)
+
+
+def ensure_movie_search_triggers():
+    ensure_fts_triggers(MOVIE_FTS_TABLE, MOVIE_FTS_TRIGGERS)
+
+
+def ensure_person_search_triggers():
+    ensure_fts_triggers(PERSON_FTS_TABLE, PERSON_FTS_TRIGGERS)
+
+
+def search_movie_queryset(queryset, value):
+    if not fts_available():
+        return queryset.filter(Q(title__icontains=value) | Q(description__icontains=value))
+
+    match = build_match_query(value)
+    if not match:
+        return queryset.none()
+
+    # Соединение с индексом, а не коррелированный подзапрос: MATCH выполняется один раз.
+    # rank (bm25) отрицательный: чем меньше, тем релевантнее
+    table = MOVIE_FTS_TABLE
+    return queryset.extra(
+        tables=[table],
+        where=[f'{table}.rowid = catalog_movie.id', f'{table} MATCH %s'],
+        params=[match],
+        select={'_search_rank': f'{table}.rank'},
+        order_by=['_search_rank', 'id'],
+    )
+
+
+def search_person_biography(queryset, value):
+    if not fts_available():
+        return queryset.filter(biography_text__icontains=value)
+
+    match = build_match_query(value)
+    if not match:
+        return queryset.none()
+
+    table = PERSON_FTS_TABLE
+    return queryset.extra(
+        tables=[table],
+        where=[f'{table}.rowid = catalog_person.id', f'{table} MATCH %s'],
+        params=[match],
+        select={'_search_rank': f'{table}.rank'},
+        order_by=['_search_rank', 'id'],
+    )
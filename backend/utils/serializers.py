@@ -16,7 +16,7 @@ class BaseModelSerializer(serializers.ModelSerializer):
 
         if exclude_fields:
             for field_name in exclude_fields:
-                self.fields.pop(field_name)
+                self.fields.pop(field_name, None)
 
 
 def get_fields(obj, *field_names):
@@ -0,0 +1,52 @@
+import numpy as np
+from scipy import sparse
+
+
+def top_k_similar(user_index, movie_index, rates, shape, k=20, min_common=2, adjusted=True, chunk_size=2000):
+    # Item-to-item сходство по матрице пользователь x фильм.
+    # adjusted=True - adjusted cosine: из оценок вычитается средняя оценка пользователя.
+    # Произведение X.T @ X считается блоками по chunk_size столбцов, поэтому
+    # в памяти никогда не бывает плотной матрицы фильм x фильм.
+    # Возвращает итератор (индекс фильма, индексы соседей, сходства).
+    n_users, n_movies = shape
+    rates = np.asarray(rates, dtype=np.float64)
+    if adjusted:
+        sums = np.bincount(user_index, weights=rates, minlength=n_users)
+        counts = np.bincount(user_index, minlength=n_users)
+        rates = rates - (sums / np.maximum(counts, 1))[user_index]
+
+    matrix = sparse.csc_matrix((rates, (user_index, movie_index)), shape=shape)
+    matrix.eliminate_zeros()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1
+    matrix = (matrix @ sparse.diags(1 / norms)).tocsc()
+    transposed = matrix.T.tocsr()
+
+    # Количество общих оценивших: сходство по одному-двум пользователям шумное
+    rated = sparse.csc_matrix((np.ones(len(rates)), (user_index, movie_index)), shape=shape)
+    rated_transposed = rated.T.tocsr()
+
+    for start in range(0, n_movies, chunk_size):
+        stop = min(start + chunk_size, n_movies)
+        scores = (transposed @ matrix[:, start:stop]).tocsc()
+        common = (rated_transposed @ rated[:, start:stop]).tocsc()
+        scores.sort_indices()
+        common.sort_indices()
+        for column in range(stop - start):
+            begin, end = scores.indptr[column], scores.indptr[column + 1]
+            neighbours = scores.indices[begin:end]
+            values = scores.data[begin:end]
+
+            # Ненулевое сходство возможно только при общих оценках, поэтому
+            # позиции соседей всегда есть в столбце common
+            common_begin, common_end = common.indptr[column], common.indptr[column + 1]
+            positions = np.searchsorted(common.indices[common_begin:common_end], neighbours)
+            support = common.data[common_begin:common_end][positions]
+
+            mask = (values > 0) & (support >= min_common) & (neighbours != start + column)
+            neighbours, values = neighbours[mask], values[mask]
+            if len(values) > k:
+                best = np.argpartition(-values, k)[:k]
+                neighbours, values = neighbours[best], values[best]
+            order = np.argsort(-values, kind='stable')
+            yield start + column, neighbours[order], values[order]
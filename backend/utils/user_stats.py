@@ -0,0 +1,53 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+USER_STATS_FIELDS = ('watches', 'rates', 'reviews')
+
+
+def rating_stats(is_watched, rate):
+    # Вклад одной оценки в счетчики пользователя
+    return {'watches': int(bool(is_watched)), 'rates': int(rate is not None)}
+
+
+def apply_stats_delta(stats_model, user_id, **deltas):
+    # Один UPDATE с F(): параллельные изменения не теряются. False - строки счетчиков нет
+    values = {
+        name: F(name) + delta if delta > 0 else Greatest(F(name) + delta, Value(0))
+        for name, delta in deltas.items() if delta
+    }
+    return not values or bool(stats_model.objects.filter(user_id=user_id).update(**values))
+
+
+def stats_expressions(rating_model, review_model):
+    # По подзапросу на счетчик: в отличие от Count по двум join, строки оценок
+    # и рецензий не перемножаются
+    def count(model, **filters):
+        rows = model.objects.filter(user=OuterRef('user_id'), **filters).order_by().values('user')
+        return Coalesce(Subquery(rows.annotate(total=Count('pk')).values('total')), Value(0))
+
+    return {
+        'watches': count(rating_model, is_watched=True),
+        'rates': count(rating_model, rate__isnull=False),
+        'reviews': count(review_model),
+    }
+
+
+def rebuild_user_stats(stats_model, rating_model, review_model, user_ids=None, batch_size=500):
+    # Создает недостающие строки и пересчитывает разошедшиеся с оценками и рецензиями
+    # счетчики. Возвращает (создано, исправлено)
+    user_model = stats_model._meta.get_field('user').related_model
+    users = user_model.objects.all() if user_ids is None else user_model.objects.filter(pk__in=user_ids)
+    missing = [stats_model(user_id=pk) for pk in users.filter(stats__isnull=True).values_list('pk', flat=True)]
+    stats_model.objects.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True)
+
+    expressions = stats_expressions(rating_model, review_model)
+    stats = stats_model.objects.all() if user_ids is None else stats_model.objects.filter(user_id__in=user_ids)
+    stale = list(
+        stats.alias(**{f'_{name}': expression for name, expression in expressions.items()})
+        .exclude(Q(**{name: F(f'_{name}') for name in USER_STATS_FIELDS}))
+        .values_list('pk', flat=True)
+    )
+    for start in range(0, len(stale), batch_size):
+        stats_model.objects.filter(pk__in=stale[start:start + batch_size]).update(**expressions)
+    return len(missing), len(stale)
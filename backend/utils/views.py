@@ -0,0 +1,212 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from utils.cache import get_versions, make_key, normalize_query
+from utils.serializers import BaseModelSerializer
+
+
+RESPONSE_CACHE_STATS_KEY = 'response_cache:{}:{}'
+
+
+def record_response_cache(basename, result):
+    key = RESPONSE_CACHE_STATS_KEY.format(basename, result)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_response_cache_stats(basenames):
+    keys = {
+        RESPONSE_CACHE_STATS_KEY.format(basename, result): (basename, result)
+        for basename in basenames for result in ('hit', 'miss')
+    }
+    values = cache.get_many(keys)
+    stats = {basename: {'hit': 0, 'miss': 0} for basename in basenames}
+    for key, (basename, result) in keys.items():
+        stats[basename][result] = values.get(key, 0)
+    return stats
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Ответ зависит от пользователя; клиент хранит его, но перепроверяет при каждом запросе
+    patch_vary_headers(response, ('Authorization', 'Cookie'))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_data_response(request, data):
+    # Для небольших закешированных данных (действия filter): ETag - хеш содержимого,
+    # при совпадении с If-None-Match ответ 304 без отрисовки
+    etag = make_etag(json.dumps(data, cls=JSONEncoder, sort_keys=True, ensure_ascii=False))
+    response = get_conditional_response(request, etag=etag) or Response(data)
+    return set_validators(response, etag)
+
+
+def parse_list_param(query_params, name):
+    return {value.strip() for item in query_params.getlist(name) for value in item.split(',') if value.strip()}
+
+
+def parse_limit_param(query_params, default, maximum):
+    # ?limit= действий с выборкой фиксированной длины: целое от 1 до maximum
+    try:
+        return max(1, min(int(query_params.get('limit', default)), maximum))
+    except ValueError:
+        raise ValidationError({'limit': 'Ожидается целое число.'})
+
+
+# Выбор полей ответа: ?fields=id,title,poster оставляет только перечисленные поля,
+# ?omit=user_actions убирает поля. Работает для чтения и сериализаторов на основе
+# BaseModelSerializer. get_queryset вьюсета проверяет is_field_requested, чтобы не
+# делать аннотации, join и prefetch для полей, которых не будет в ответе.
+class SparseFieldsetsMixin:
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+    sort_query_param = 'sort'
+
+    def get_requested_fields(self):
+        if not hasattr(self, '_requested_fields'):
+            params = self.request.query_params
+            if self.request.method in SAFE_METHODS:
+                self._requested_fields = (
+                    parse_list_param(params, self.fields_query_param),
+                    parse_list_param(params, self.omit_query_param),
+                )
+            else:
+                self._requested_fields = (set(), set())
+        return self._requested_fields
+
+    def get_serializer_field_names(self):
+        if not hasattr(self, '_serializer_field_names'):
+            self._serializer_field_names = set(self.get_serializer_class()().fields)
+        return self._serializer_field_names
+
+    def is_field_requested(self, name):
+        # Поле, по которому сортируется список, нужно в queryset даже без вывода
+        sort_fields = parse_list_param(self.request.query_params, self.sort_query_param)
+        if name in {value.lstrip('-') for value in sort_fields}:
+            return True
+        include, exclude = self.get_requested_fields()
+        if name in exclude or (include and name not in include):
+            return False
+        return name in self.get_serializer_field_names()
+
+    def get_serializer(self, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        include, exclude = self.get_requested_fields()
+        if issubclass(serializer_class, BaseModelSerializer):
+            if include:
+                kwargs.setdefault('include_fields', include)
+            if exclude:
+                kwargs.setdefault('exclude_fields', exclude)
+        kwargs.setdefault('context', self.get_serializer_context())
+        return serializer_class(*args, **kwargs)
+
+
+class ResponseDependenciesMixin:
+    # Модели, от данных которых зависит ответ; их версии входят в ключи кеша и ETag
+    response_cache_dependencies = None
+
+    def get_response_cache_dependencies(self):
+        return self.response_cache_dependencies or [self.queryset.model._meta.model_name]
+
+    def get_response_versions(self):
+        # Версии, из которых строятся ETag, Last-Modified и ключ кеша ответа
+        return get_versions(*self.get_response_cache_dependencies())
+
+
+# Условные GET для list/retrieve. ETag и Last-Modified вычисляются из версий
+# моделей (utils.cache), пути, параметров, формата ответа и пользователя, поэтому
+# на If-None-Match / If-Modified-Since ответ 304 отдается до запроса к БД и сериализации.
+# Как и CachedResponseMixin, требует общего для процессов кеша (settings.CACHES).
+class ConditionalGetMixin(ResponseDependenciesMixin):
+    conditional_actions = ('list', 'retrieve')
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.conditional_actions:
+            return handler(request, *args, **kwargs)
+
+        versions = self.get_response_versions()
+        etag = make_etag(
+            request.path,
+            normalize_query(request.query_params),
+            request.accepted_media_type,
+            request.user.pk,
+            sorted(versions.items()),
+        )
+        # Версия - время изменения в наносекундах
+        last_modified = max(versions.values()) // 10 ** 9
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        return set_validators(response, etag, last_modified)
+
+
+# Кеш ответов list/retrieve для анонимных пользователей.
+# Ключ: хост, путь, нормализованные параметры запроса и версии моделей из
+# response_cache_dependencies, поэтому запись в любую из них (сигналы
+# catalog.signals) делает старые ответы недоступными. Версии и ответы берутся
+# из кеша default: при нескольких процессах он должен быть общим
+# (settings.CACHES), иначе воркеры отдают устаревшие ответы.
+class CachedResponseMixin(ResponseDependenciesMixin):
+    response_cache_actions = ('list', 'retrieve')
+
+    def get_response_cache_key(self, request):
+        versions = self.get_response_versions()
+        return make_key(
+            'response',
+            request.get_host(),
+            request.path,
+            sorted(versions.items()),
+            normalize_query(request.query_params),
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated or self.action not in self.response_cache_actions:
+            return handler(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            record_response_cache(self.basename, 'hit')
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        record_response_cache(self.basename, 'miss')
+        response['X-Cache'] = 'MISS'
+        return response